@@ -3,72 +3,168 @@
 基于FastAPI的前后端分离架构，支持每日验证码和大模型工作流
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
+import os
+import json
 import sqlite3
 import asyncio
 import logging
 from datetime import datetime, timedelta
 import secrets
 import hashlib
-import json
-from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, EmailStr
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import aiofiles
+import hmac
+import time
+import orjson
+from typing import Optional, List, Dict, Any, Union
+from pydantic import BaseModel, ConfigDict
+import aiosmtplib
+from email.message import EmailMessage
 import httpx
 import uuid
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 
-from config.settings import Settings
-from database.models import init_database
+from config.settings import settings
+from database.models import (
+    init_database, optimize_database, checkpoint_database, archive_old_logs, close_db_connection,
+    start_log_writer, stop_log_writer, SessionManager, DailyCodeManager
+)
 from workflows.base import WorkflowManager
 from workflows.poem_generator import PoemWorkflow
 from utils.logger import setup_logger
+from utils.security import SecurityHeadersMiddleware
 
 # 配置日志
 logger = setup_logger(__name__)
 
-# 初始化配置
-settings = Settings()
-
 # 数据模型
+# 请求模型：严格类型校验，拒绝未声明的字段
+_STRICT_MODEL_CONFIG = ConfigDict(strict=True, extra="forbid", str_strip_whitespace=True)
+
 class LoginRequest(BaseModel):
+    model_config = _STRICT_MODEL_CONFIG
+    
     username: str
     daily_code: str
 
 class WorkflowRequest(BaseModel):
+    model_config = _STRICT_MODEL_CONFIG
+    
     workflow_type: str
     inputs: Dict[str, Any]
 
 class UserInfo(BaseModel):
+    model_config = _STRICT_MODEL_CONFIG
+    
     username: str
-    email: EmailStr
+    email: str
 
 # 安全中间件
 security = HTTPBearer()
 
+# 已验证token缓存：token哈希 -> (用户名, 过期时间戳)，命中时无需查询数据库
+_token_cache = TTLCache(maxsize=10000, ttl=60)
+
+# 每日验证码生成失败后的重试间隔和补偿窗口（秒）
+DAILY_CODE_RETRY_DELAY_SECONDS = 60
+DAILY_CODE_MISFIRE_GRACE_SECONDS = 3600
+# 等待下一次执行时单次睡眠的最长时间（秒）
+DAILY_CODE_MAX_SLEEP_SECONDS = 3600
+
+# 过期会话清理间隔（秒），由后台任务执行，不占用登录请求
+SESSION_SWEEP_INTERVAL_SECONDS = 300
+
+# 数据库维护间隔（秒）：更新统计信息，保证查询规划器选择合适的索引；执行WAL检查点，限制WAL文件大小
+DB_OPTIMIZE_INTERVAL_SECONDS = 3600
+
+# 日志归档间隔（秒），超过保留天数的日志移入归档表
+LOG_ARCHIVE_INTERVAL_SECONDS = 24 * 60 * 60
+
+# 每日验证码有效期（秒）
+DAILY_CODE_TTL_SECONDS = 24 * 60 * 60
+# 发送验证码邮件的租约（秒）：持有租约的进程负责发送，进程中途退出时租约到期后由其他进程补发
+DAILY_CODE_SEND_LEASE_SECONDS = 600
+
+# 旧版验证码文件（验证码已改为存储在数据库中，启动时自动导入）
+LEGACY_DAILY_CODES_FILE = "data/daily_codes.json"
+
+# 静态文件缓存策略：文件名不带版本号，缓存1小时后通过ETag重新验证
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+# 活动日志写入队列（启动时创建），由后台任务批量写入数据库
+ACTIVITY_LOG_DB = "data/activity_logs.db"
+ACTIVITY_LOG_BATCH_SIZE = 500
+# 活动日志数据库内存映射读取的大小上限（字节）
+ACTIVITY_LOG_MMAP_SIZE = 256 * 1024 * 1024
+# 活动日志保留天数，更早的记录移入 activity_logs_archive 表
+ACTIVITY_LOG_RETENTION_DAYS = 30
+_log_queue: Optional[asyncio.Queue] = None
+
+# 验证码生成锁（启动时创建），保证同一时间只有一个生成任务
+_code_generation_lock: Optional[asyncio.Lock] = None
+
+# 活动日志数据库的所有操作都在同一个线程中执行，共享一个长连接
+_log_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="activity-log-db")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    global _log_queue, _code_generation_lock
+    
     # 启动时初始化
     await init_database()
+    await migrate_legacy_daily_codes()
+    await start_log_writer()
     logger.info("数据库初始化完成")
     
+    # 打开活动日志数据库并启动批量写入任务
+    app.state.log_db = await _run_log_db(_open_activity_log_db)
+    _log_queue = asyncio.Queue()
+    log_flusher = asyncio.create_task(activity_log_flusher(_log_queue, app.state.log_db))
+    
+    # 创建工作流共享的HTTP客户端，复用到外部API的连接
+    app.state.http_client = httpx.AsyncClient(
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+    )
+    workflow_manager.set_http_client(app.state.http_client)
+    
     # 检查并生成当日验证码
+    _code_generation_lock = asyncio.Lock()
     await check_and_generate_today_codes()
     
     # 启动每日验证码生成任务
-    asyncio.create_task(daily_code_generator())
+    code_generator = asyncio.create_task(daily_code_generator())
     logger.info("每日验证码生成任务启动")
     
+    # 启动过期会话清理任务
+    session_cleaner = asyncio.create_task(session_cleanup_task())
+    
+    # 启动数据库统计信息更新任务
+    db_optimizer = asyncio.create_task(database_optimize_task())
+    
+    # 启动日志归档任务（启动时先执行一次）
+    log_archiver = asyncio.create_task(log_archive_task())
+    
     yield
     
-    # 关闭时清理
+    # 关闭时清理：停止定时任务，写入队列中剩余的活动日志
+    code_generator.cancel()
+    session_cleaner.cancel()
+    db_optimizer.cancel()
+    log_archiver.cancel()
+    await _log_queue.put(None)
+    await log_flusher
+    await _run_log_db(app.state.log_db.close)
+    await stop_log_writer()
+    await close_db_connection()
+    workflow_manager.set_http_client(None)
+    await app.state.http_client.aclose()
     logger.info("应用关闭")
 
 # 创建FastAPI应用
@@ -76,7 +172,8 @@ app = FastAPI(
     title="安全AI工作流服务",
     description="基于每日验证码的安全AI工作流平台",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS配置
@@ -88,8 +185,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 安全响应头
+app.add_middleware(SecurityHeadersMiddleware)
+
+class CachedStaticFiles(StaticFiles):
+    """带浏览器缓存头的静态文件服务（生产环境建议由nginx直接提供静态文件）"""
+    
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", STATIC_CACHE_CONTROL)
+        return response
+
 # 静态文件服务
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
+app.mount("/static", CachedStaticFiles(directory="frontend"), name="static")
 
 # 工作流管理器
 workflow_manager = WorkflowManager()
@@ -99,11 +207,33 @@ workflow_manager.register_workflow("poem", PoemWorkflow())
 from workflows.text_analyzer import TextAnalyzerWorkflow
 workflow_manager.register_workflow("text_analyzer", TextAnalyzerWorkflow())
 
+# 工作流列表ETag前缀，区分不同进程（重启后统计信息从零开始）
+_WORKFLOWS_ETAG_PREFIX = uuid.uuid4().hex[:8]
+
+# 已编码的工作流列表响应体：(版本号, JSON字节串)，版本号不变时直接复用
+_workflows_body_cache = (None, b"")
+
+def _get_workflows_body() -> bytes:
+    """获取工作流列表的JSON响应体，仅在工作流或统计信息变化后重新编码"""
+    global _workflows_body_cache
+    revision = workflow_manager.revision
+    if _workflows_body_cache[0] != revision:
+        body = orjson.dumps({"workflows": workflow_manager.get_available_workflows()})
+        _workflows_body_cache = (revision, body)
+    return _workflows_body_cache[1]
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """验证当前用户token"""
+    token = credentials.credentials
+    token_key = _token_key(token)
+    
+    # 快速路径：已验证过的token直接从缓存返回
+    username = _get_cached_user(token_key)
+    if username:
+        return username
+    
     try:
-        token = credentials.credentials
-        username = await verify_token(token)
+        username = await verify_token(token, token_key)
         if not username:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -151,19 +281,32 @@ async def get_current_admin(current_user: str = Depends(get_current_user)) -> st
             detail="权限验证失败"
         )
 
-async def verify_token(token: str) -> Optional[str]:
+def _token_key(token: str) -> str:
+    """计算token存储键（数据库和缓存中均不保存明文token）"""
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+def _get_cached_user(token_key: str) -> Optional[str]:
+    """从缓存获取已验证token对应的用户名"""
+    cached = _token_cache.get(token_key)
+    if cached and time.time() < cached[1]:
+        return cached[0]
+    return None
+
+async def verify_token(token: str, token_key: Optional[str] = None) -> Optional[str]:
     """验证访问令牌"""
+    if token_key is None:
+        token_key = _token_key(token)
+    
+    username = _get_cached_user(token_key)
+    if username:
+        return username
+    
     try:
-        async with aiofiles.open("data/active_tokens.json", "r", encoding="utf-8") as f:
-            content = await f.read()
-            tokens = json.loads(content) if content else {}
-        
-        if token in tokens:
-            token_info = tokens[token]
-            # 检查token是否过期（24小时有效期）
-            issued_time = datetime.fromisoformat(token_info["issued_at"])
-            if datetime.now() - issued_time < timedelta(hours=24):
-                return token_info["username"]
+        # 会话表按token主键查询，24小时有效期由SQL判断
+        session = await SessionManager.get_active_session(token_key)
+        if session:
+            _token_cache[token_key] = (session["username"], session["expires_at"])
+            return session["username"]
         
         return None
     except Exception as e:
@@ -173,12 +316,13 @@ async def verify_token(token: str) -> Optional[str]:
 async def check_and_generate_today_codes():
     """检查并生成当日验证码（如果还没有的话）"""
     try:
-        # 检查是否已有今日验证码
-        has_valid_codes = await has_today_valid_codes()
+        # 验证码和用户配置只读取一次，检查和生成共用
+        users = settings.get_users()
+        daily_codes = await _load_daily_codes()
         
-        if not has_valid_codes:
-            logger.info("未找到当日有效验证码，正在生成...")
-            await generate_and_send_daily_codes()
+        if not _codes_valid_for_today(daily_codes, users):
+            logger.info("未找到当日有效验证码或有邮件未送达，正在生成或补发...")
+            await generate_and_send_daily_codes(users)
             logger.info("当日验证码生成并发送完成")
         else:
             logger.info("当日验证码已存在且有效")
@@ -187,136 +331,331 @@ async def check_and_generate_today_codes():
         logger.error(f"检查并生成当日验证码失败: {e}")
         # 即使失败也不阻止应用启动，只记录错误
 
-async def has_today_valid_codes() -> bool:
-    """检查是否有当日有效的验证码"""
+def _read_legacy_daily_codes() -> Dict[str, Any]:
+    """读取旧版验证码JSON文件，ISO格式的生成时间转换为Unix时间戳"""
+    with open(LEGACY_DAILY_CODES_FILE, "rb") as f:
+        content = f.read()
+    daily_codes = orjson.loads(content) if content else {}
+    for info in daily_codes.values():
+        if isinstance(info.get("generated_at"), str):
+            info["generated_at"] = datetime.fromisoformat(info["generated_at"]).timestamp()
+        # 旧版生成验证码时已发送过邮件
+        info["delivered"] = True
+    return daily_codes
+
+async def migrate_legacy_daily_codes():
+    """将旧版 daily_codes.json 中的验证码导入数据库（仅执行一次），避免升级后重复发送邮件"""
+    if not os.path.exists(LEGACY_DAILY_CODES_FILE):
+        return
+    
     try:
-        # 读取现有验证码
-        async with aiofiles.open("data/daily_codes.json", "r", encoding="utf-8") as f:
-            content = await f.read()
-            daily_codes = json.loads(content) if content else {}
-        
-        if not daily_codes:
+        if not await DailyCodeManager.get_all_codes():
+            daily_codes = await asyncio.to_thread(_read_legacy_daily_codes)
+            await DailyCodeManager.save_codes(daily_codes)
+            logger.info(f"已从旧版验证码文件导入 {len(daily_codes)} 条验证码")
+        os.replace(LEGACY_DAILY_CODES_FILE, f"{LEGACY_DAILY_CODES_FILE}.migrated")
+    except Exception as e:
+        logger.error(f"导入旧版验证码文件失败: {e}")
+
+async def _load_daily_codes() -> Dict[str, Any]:
+    """读取已生成的全部验证码"""
+    return await DailyCodeManager.get_all_codes()
+
+def _codes_generated_today(daily_codes: Dict[str, Any], users: Dict[str, Dict[str, Any]]) -> bool:
+    """检查是否每个用户都有当日生成且未过期的验证码"""
+    if not daily_codes:
+        return False
+    
+    now = time.time()
+    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    
+    for username in users.keys():
+        if username not in daily_codes:
             return False
         
-        # 获取用户列表
-        users = settings.get_users()
-        today = datetime.now().date()
-        
-        # 检查每个用户是否都有今日有效验证码
-        for username in users.keys():
-            if username not in daily_codes:
-                return False
-            
-            user_code_info = daily_codes[username]
-            generated_time = datetime.fromisoformat(user_code_info["generated_at"])
-            
-            # 检查是否是今天生成的且在24小时内
-            if (generated_time.date() != today or 
-                datetime.now() - generated_time > timedelta(hours=24)):
-                return False
-        
-        return True
+        generated_at = daily_codes[username]["generated_at"]
         
-    except FileNotFoundError:
-        # 文件不存在，说明没有验证码
-        return False
+        # 检查是否是今天生成的且在24小时内
+        if generated_at < today_start or now - generated_at > DAILY_CODE_TTL_SECONDS:
+            return False
+    
+    return True
+
+def _codes_valid_for_today(daily_codes: Dict[str, Any], users: Dict[str, Dict[str, Any]]) -> bool:
+    """检查当日验证码是否已生成且邮件已全部送达，有未送达的用户时需要补发"""
+    return _codes_generated_today(daily_codes, users) and all(
+        daily_codes[username]["delivered"] for username in users.keys()
+    )
+
+async def has_today_valid_codes() -> bool:
+    """检查是否有当日有效的验证码"""
+    try:
+        return _codes_valid_for_today(await _load_daily_codes(), settings.get_users())
     except Exception as e:
         logger.error(f"检查当日验证码失败: {e}")
         return False
 
+async def session_cleanup_task():
+    """定期清理过期会话"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        try:
+            await SessionManager.cleanup_expired_sessions()
+        except Exception as e:
+            logger.error(f"清理过期会话失败: {e}")
+
+async def database_optimize_task():
+    """定期更新数据库统计信息并执行WAL检查点"""
+    while True:
+        await asyncio.sleep(DB_OPTIMIZE_INTERVAL_SECONDS)
+        await optimize_database()
+        await checkpoint_database()
+        try:
+            await _run_log_db(app.state.log_db.execute, "PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            logger.error(f"活动日志数据库WAL检查点失败: {e}")
+
+async def log_archive_task():
+    """定期归档超过保留期的日志"""
+    while True:
+        try:
+            archived = await archive_old_logs()
+            cutoff = (datetime.utcnow() - timedelta(days=ACTIVITY_LOG_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+            archived += await _run_log_db(_archive_activity_logs, app.state.log_db, cutoff)
+            if archived:
+                logger.info(f"已归档 {archived} 条过期日志")
+        except Exception as e:
+            logger.error(f"归档日志失败: {e}")
+        await asyncio.sleep(LOG_ARCHIVE_INTERVAL_SECONDS)
+
+def _next_daily_code_run(now: datetime) -> datetime:
+    """计算下一次生成验证码的时间（每天00:01）"""
+    next_run = now.replace(hour=0, minute=1, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return next_run
+
+async def _run_daily_code_job():
+    """执行一次验证码任务：没有当日验证码时生成并发送，有未送达的邮件时补发，失败时抛出异常"""
+    # 检查是否需要生成验证码（避免重复生成）
+    if await has_today_valid_codes():
+        logger.info("定时任务：当日验证码已存在，跳过生成")
+        return
+    
+    if await generate_and_send_daily_codes():
+        logger.info("定时任务：每日验证码生成并发送完成")
+    else:
+        logger.info("定时任务：未送达的验证码邮件补发完成")
+
 async def daily_code_generator():
     """每日验证码生成和发送任务"""
+    if await has_today_valid_codes():
+        scheduled_run = _next_daily_code_run(datetime.now())
+        next_attempt = scheduled_run
+    else:
+        # 启动时未能送达全部验证码邮件，从现在起在补偿窗口内重试补发
+        scheduled_run = datetime.now()
+        next_attempt = scheduled_run + timedelta(seconds=DAILY_CODE_RETRY_DELAY_SECONDS)
+    
     while True:
+        # 分段睡眠并每次重新对照系统时间，系统时间调整或休眠恢复后不会错过或提前执行
+        while (sleep_seconds := (next_attempt - datetime.now()).total_seconds()) > 0:
+            await asyncio.sleep(min(sleep_seconds, DAILY_CODE_MAX_SLEEP_SECONDS))
+        
         try:
-            # 每天凌晨00:01生成新的验证码
-            now = datetime.now()
-            tomorrow = now.replace(hour=0, minute=1, second=0, microsecond=0) + timedelta(days=1)
-            sleep_seconds = (tomorrow - now).total_seconds()
-            
-            if sleep_seconds > 0:
-                await asyncio.sleep(sleep_seconds)
+            await _run_daily_code_job()
             
-            # 检查是否需要生成验证码（避免重复生成）
-            has_valid_codes = await has_today_valid_codes()
-            if not has_valid_codes:
-                await generate_and_send_daily_codes()
-                logger.info("定时任务：每日验证码生成并发送完成")
-            else:
-                logger.info("定时任务：当日验证码已存在，跳过生成")
+            scheduled_run = _next_daily_code_run(datetime.now())
+            next_attempt = scheduled_run
             
         except Exception as e:
             logger.error(f"每日验证码生成任务错误: {e}")
-            await asyncio.sleep(60)  # 出错后等待1分钟重试
+            
+            # 在补偿窗口内重试本次任务（只补发未送达的邮件），超出窗口则等待下一个周期
+            retry_at = datetime.now() + timedelta(seconds=DAILY_CODE_RETRY_DELAY_SECONDS)
+            if (retry_at - scheduled_run).total_seconds() <= DAILY_CODE_MISFIRE_GRACE_SECONDS:
+                next_attempt = retry_at
+            else:
+                scheduled_run = _next_daily_code_run(datetime.now())
+                next_attempt = scheduled_run
+
+# 每日验证码邮件正文模板
+DAILY_CODE_EMAIL_TEMPLATE = """尊敬的 {username}，
+
+您的今日登录验证码是：{code}
+
+此验证码有效期为24小时，请及时使用。
+
+祝您使用愉快！
+AI工作流平台
+"""
 
-async def generate_and_send_daily_codes():
-    """生成并发送每日验证码"""
+async def generate_and_send_daily_codes(
+    users: Optional[Dict[str, Dict[str, Any]]] = None,
+    force: bool = False
+) -> bool:
+    """
+    生成并发送每日验证码
+    
+    Args:
+        users: 调用方已读取的用户配置，为None时从配置中读取
+        force: 为True时即使已有当日有效验证码也重新生成（管理员手动触发）
+    
+    Returns:
+        是否生成了新的验证码（只补发未送达的邮件时为False）
+    """
     try:
-        # 读取用户配置
-        users = settings.get_users()
-        daily_codes = {}
-        
-        for username, user_info in users.items():
-            # 为每个用户生成唯一的6位数字验证码
-            code = secrets.randbelow(900000) + 100000
-            daily_codes[username] = {
-                "code": str(code),
-                "generated_at": datetime.now().isoformat(),
-                "email": user_info["email"]
-            }
+        # 进程内串行化定时任务和手动触发；多个进程（如gunicorn多worker）之间
+        # 由数据库写事务保证只有一个进程保存新验证码，并由持有发送租约的进程发送邮件
+        async with _code_generation_lock:
+            # 读取用户配置
+            if users is None:
+                users = settings.get_users()
+            
+            # 同一批验证码共用一个生成时间
+            generated_at = int(time.time())
+            new_codes = {}
+            codes = _generate_codes(len(users))
+            for (username, user_info), code in zip(users.items(), codes):
+                new_codes[username] = {
+                    "code": code,
+                    "generated_at": generated_at,
+                    "email": user_info["email"]
+                }
             
-            # 发送邮件
-            await send_daily_code_email(user_info["email"], username, str(code))
+            # 在写事务中再次检查，其他任务或进程可能已经生成了当日验证码；保存时为未送达，邮件送达后再逐个标记
+            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            generated_since = max(today_start, time.time() - DAILY_CODE_TTL_SECONDS)
+            generated = await DailyCodeManager.save_codes_if_stale(
+                new_codes, generated_since, DAILY_CODE_SEND_LEASE_SECONDS, force
+            )
+            if generated:
+                pending_codes = new_codes
+            else:
+                # 当日验证码已生成，只给邮件尚未送达且无人正在发送的用户补发原验证码
+                pending_codes = await DailyCodeManager.claim_undelivered(
+                    list(users.keys()), DAILY_CODE_SEND_LEASE_SECONDS
+                )
+                if not pending_codes:
+                    logger.info("当日验证码已由其他任务生成，跳过")
+                    return False
+            
+            failed_users = await _deliver_daily_codes(pending_codes)
+        
+        if generated:
+            logger.info(f"为 {len(users)} 个用户生成了每日验证码，邮件发送失败 {len(failed_users)} 个")
+        else:
+            logger.info(f"为 {len(pending_codes)} 个用户补发了每日验证码，邮件发送失败 {len(failed_users)} 个")
         
-        # 保存验证码
-        async with aiofiles.open("data/daily_codes.json", "w", encoding="utf-8") as f:
-            await f.write(json.dumps(daily_codes, ensure_ascii=False, indent=2))
+        if failed_users:
+            raise RuntimeError(f"以下用户的验证码邮件发送失败: {', '.join(failed_users)}")
         
-        logger.info(f"为 {len(users)} 个用户生成并发送了每日验证码")
+        return generated
         
     except Exception as e:
         logger.error(f"生成每日验证码失败: {e}")
         raise
 
-async def send_daily_code_email(email: str, username: str, code: str):
-    """发送每日验证码邮件"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = settings.SMTP_USERNAME
-        msg['To'] = email
-        msg['Subject'] = f"AI工作流平台每日登录码 - {datetime.now().strftime('%Y-%m-%d')}"
-        
-        body = f"""
-        尊敬的 {username}，
-        
-        您的今日登录验证码是：{code}
-        
-        此验证码有效期为24小时，请及时使用。
-        
-        祝您使用愉快！
-        AI工作流平台
-        """
-        
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # 异步发送邮件
-        await asyncio.get_event_loop().run_in_executor(
-            None, 
-            lambda: _send_email_sync(msg, email)
+# 6位数字验证码取值范围，以及3字节随机数中可无偏映射到该范围的上限
+_CODE_RANGE = 900000
+_CODE_SAMPLE_LIMIT = (1 << 24) // _CODE_RANGE * _CODE_RANGE
+
+def _generate_codes(count: int) -> List[str]:
+    """一次读取全部随机字节，批量生成6位数字验证码"""
+    raw = secrets.token_bytes(3 * count)
+    codes = []
+    for i in range(0, len(raw), 3):
+        value = int.from_bytes(raw[i:i + 3], "big")
+        # 超出上限的值会导致取模分布不均匀，拒绝后单独重新抽取
+        if value >= _CODE_SAMPLE_LIMIT:
+            value = secrets.randbelow(_CODE_RANGE)
+        codes.append(str(value % _CODE_RANGE + 100000))
+    return codes
+
+def _build_daily_code_message(email: str, username: str, code: str, subject: str) -> EmailMessage:
+    """构建每日验证码邮件"""
+    msg = EmailMessage()
+    msg['From'] = settings.SMTP_USERNAME
+    msg['To'] = email
+    msg['Subject'] = subject
+    msg.set_content(DAILY_CODE_EMAIL_TEMPLATE.format(username=username, code=code))
+    return msg
+
+class SMTPSession:
+    """SMTP会话异步上下文管理器：整批邮件只建立一次连接、完成一次STARTTLS和登录"""
+    
+    def __init__(self):
+        self._smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_SERVER,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            start_tls=True
         )
-        
-        logger.info(f"每日验证码邮件已发送至: {email}")
-        
+        self._reconnect_lock = asyncio.Lock()
+    
+    async def __aenter__(self) -> "SMTPSession":
+        await self._smtp.connect()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._smtp.quit()
+        except aiosmtplib.SMTPException:
+            self._smtp.close()
+    
+    async def send(self, msg: EmailMessage):
+        """发送一封邮件，连接被服务器断开时重连一次后重试"""
+        try:
+            await self._smtp.send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            # 并发发送时只由第一个发现断开的任务负责重连
+            async with self._reconnect_lock:
+                if not self._smtp.is_connected:
+                    await self._smtp.connect()
+            await self._smtp.send_message(msg)
+
+async def _deliver_daily_codes(daily_codes: Dict[str, Dict[str, Any]]) -> List[str]:
+    """发送验证码邮件并标记已送达的用户，返回发送失败的用户名"""
+    # 构建全部邮件后通过同一个SMTP连接发送，单个用户发送失败不影响其他用户
+    subject = f"AI工作流平台每日登录码 - {datetime.now().strftime('%Y-%m-%d')}"
+    messages = [
+        (username, _build_daily_code_message(info["email"], username, info["code"], subject))
+        for username, info in daily_codes.items()
+    ]
+    try:
+        failed_users = await _send_daily_code_emails(messages)
     except Exception as e:
-        logger.error(f"发送邮件失败 ({email}): {e}")
-        raise
-
-def _send_email_sync(msg: MIMEMultipart, email: str):
-    """同步发送邮件"""
-    server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-    server.starttls()
-    server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-    server.send_message(msg)
-    server.quit()
+        # 连接或登录SMTP服务器失败时全部用户都未送达
+        logger.error(f"连接邮件服务器失败: {e}")
+        failed_users = list(daily_codes.keys())
+    
+    failed = set(failed_users)
+    delivered_users = [username for username in daily_codes.keys() if username not in failed]
+    if delivered_users:
+        await DailyCodeManager.mark_delivered(delivered_users)
+    if failed_users:
+        await DailyCodeManager.release_claims(failed_users)
+    
+    return failed_users
+
+async def _send_daily_code_emails(messages: List[tuple]) -> List[str]:
+    """通过同一个SMTP会话并发发送邮件，返回发送失败的用户名"""
+    async with SMTPSession() as session:
+        results = await asyncio.gather(
+            *(session.send(msg) for _, msg in messages),
+            return_exceptions=True
+        )
+    
+    failed_users = []
+    for (username, msg), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"发送邮件失败 ({msg['To']}): {result}")
+            failed_users.append(username)
+        else:
+            logger.info(f"每日验证码邮件已发送至: {msg['To']}")
+    
+    return failed_users
 
 # API路由
 
@@ -324,7 +663,7 @@ def _send_email_sync(msg: MIMEMultipart, email: str):
 async def read_root():
     """根路径，返回前端页面"""
     from fastapi.responses import FileResponse
-    return FileResponse("frontend/index.html")
+    return FileResponse("frontend/index.html", headers={"Cache-Control": "public, max-age=60"})
 
 @app.post("/api/auth/login")
 async def login(request: LoginRequest):
@@ -344,7 +683,7 @@ async def login(request: LoginRequest):
         await save_access_token(token, request.username)
         
         # 记录登录日志
-        await log_user_activity(request.username, "login", {"success": True})
+        await log_user_activity(request.username, "login", _SUCCESS_DETAILS)
         
         logger.info(f"用户 {request.username} 登录成功")
         
@@ -355,7 +694,7 @@ async def login(request: LoginRequest):
         }
         
     except HTTPException:
-        await log_user_activity(request.username, "login", {"success": False})
+        await log_user_activity(request.username, "login", _FAILURE_DETAILS)
         raise
     except Exception as e:
         logger.error(f"登录处理错误: {e}")
@@ -373,22 +712,17 @@ async def verify_daily_code(username: str, code: str) -> bool:
         if username not in users:
             return False
         
-        # 读取当日验证码
-        async with aiofiles.open("data/daily_codes.json", "r", encoding="utf-8") as f:
-            content = await f.read()
-            daily_codes = json.loads(content) if content else {}
-        
-        if username not in daily_codes:
+        # 读取该用户的验证码
+        user_code_info = await DailyCodeManager.get_code(username)
+        if not user_code_info:
             return False
         
-        user_code_info = daily_codes[username]
-        generated_time = datetime.fromisoformat(user_code_info["generated_at"])
-        
         # 检查验证码是否在有效期内（24小时）
-        if datetime.now() - generated_time > timedelta(hours=24):
+        if time.time() - user_code_info["generated_at"] > DAILY_CODE_TTL_SECONDS:
             return False
         
-        return user_code_info["code"] == code
+        # 常量时间比较，避免通过响应时间推测验证码
+        return hmac.compare_digest(user_code_info["code"].encode(), code.encode())
         
     except Exception as e:
         logger.error(f"验证码验证错误: {e}")
@@ -397,34 +731,12 @@ async def verify_daily_code(username: str, code: str) -> bool:
 async def save_access_token(token: str, username: str):
     """保存访问令牌"""
     try:
-        # 读取现有token
-        try:
-            async with aiofiles.open("data/active_tokens.json", "r", encoding="utf-8") as f:
-                content = await f.read()
-                tokens = json.loads(content) if content else {}
-        except FileNotFoundError:
-            tokens = {}
-        
-        # 添加新token
-        tokens[token] = {
-            "username": username,
-            "issued_at": datetime.now().isoformat()
-        }
-        
-        # 清理过期token
-        current_time = datetime.now()
-        expired_tokens = []
-        for t, info in tokens.items():
-            issued_time = datetime.fromisoformat(info["issued_at"])
-            if current_time - issued_time > timedelta(hours=24):
-                expired_tokens.append(t)
-        
-        for t in expired_tokens:
-            del tokens[t]
-        
-        # 保存token
-        async with aiofiles.open("data/active_tokens.json", "w", encoding="utf-8") as f:
-            await f.write(json.dumps(tokens, ensure_ascii=False, indent=2))
+        # 每个用户只保留最近的若干个会话，被挤掉的会话同时从缓存中移除
+        evicted = await SessionManager.create_session(
+            _token_key(token), username, max_sessions=settings.MAX_SESSIONS_PER_USER
+        )
+        for token_key in evicted:
+            _token_cache.pop(token_key, None)
             
     except Exception as e:
         logger.error(f"保存访问令牌失败: {e}")
@@ -445,12 +757,33 @@ async def get_current_user_info(current_user: str = Depends(get_current_user)):
         }
     raise HTTPException(status_code=404, detail="用户信息未找到")
 
+@app.post("/api/auth/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: str = Depends(get_current_user)
+):
+    """退出登录，使当前访问令牌失效"""
+    token_key = _token_key(credentials.credentials)
+    
+    # 先从缓存移除，避免失效后的token在缓存有效期内仍能通过验证
+    _token_cache.pop(token_key, None)
+    await SessionManager.invalidate_session(token_key)
+    
+    await log_user_activity(current_user, "logout", _SUCCESS_DETAILS)
+    logger.info(f"用户 {current_user} 退出登录")
+    
+    return {"success": True}
+
 @app.get("/api/workflows")
-async def get_available_workflows(current_user: str = Depends(get_current_user)):
-    """获取可用的工作流列表"""
-    return {
-        "workflows": workflow_manager.get_available_workflows()
-    }
+async def get_available_workflows(request: Request, current_user: str = Depends(get_current_user)):
+    """获取可用的工作流列表（支持ETag协商缓存）"""
+    etag = f'W/"{_WORKFLOWS_ETAG_PREFIX}-{workflow_manager.revision}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return Response(_get_workflows_body(), media_type="application/json", headers=headers)
 
 @app.post("/api/workflows/execute")
 async def execute_workflow(
@@ -484,47 +817,123 @@ async def execute_workflow(
         }
         
     except Exception as e:
-        logger.error(f"工作流执行失败: {e}")
+        error = str(e)
+        logger.error(f"工作流执行失败: {error}")
         await log_user_activity(
             current_user,
             "workflow_execute_error",
             {
                 "workflow_type": request.workflow_type,
-                "error": str(e)
+                "error": error
             }
         )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"工作流执行失败: {str(e)}"
+            detail=f"工作流执行失败: {error}"
         )
 
-async def log_user_activity(username: str, activity_type: str, details: Dict[str, Any]):
-    """记录用户活动日志"""
+# 固定内容的活动详情预先序列化，高频路径上无需每次构建字典再编码
+_SUCCESS_DETAILS = orjson.dumps({"success": True})
+_FAILURE_DETAILS = orjson.dumps({"success": False})
+
+async def log_user_activity(username: str, activity_type: str, details: Union[Dict[str, Any], bytes]):
+    """记录用户活动日志（放入队列，由后台任务批量写入），details可以是已序列化的JSON字节串"""
     try:
-        conn = sqlite3.connect("data/activity_logs.db")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS activity_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                activity_type TEXT NOT NULL,
-                details TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            INSERT INTO activity_logs (username, activity_type, details)
-            VALUES (?, ?, ?)
-        """, (username, activity_type, json.dumps(details, ensure_ascii=False)))
-        
-        conn.commit()
-        conn.close()
-        
+        # 空详情存为NULL，读取时按空字典返回
+        if not isinstance(details, bytes) and details:
+            try:
+                details = orjson.dumps(details)
+            except TypeError:
+                # orjson不支持超过64位的整数等值，改用标准库json序列化
+                details = json.dumps(details, ensure_ascii=False, default=str).encode()
+        _log_queue.put_nowait((username, activity_type, details.decode() if details else None))
     except Exception as e:
         logger.error(f"记录用户活动失败: {e}")
 
+async def _run_log_db(func, *args):
+    """在活动日志数据库线程中执行同步操作，避免阻塞事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(_log_db_executor, func, *args)
+
+def _open_activity_log_db() -> sqlite3.Connection:
+    """打开活动日志数据库并初始化表结构（仅在启动时执行一次）"""
+    conn = sqlite3.connect(ACTIVITY_LOG_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA mmap_size={ACTIVITY_LOG_MMAP_SIZE}")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            activity_type TEXT NOT NULL,
+            details TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # 日志查询按时间倒序取最近N条，有索引时可直接逆序遍历并在LIMIT处停止
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp
+        ON activity_logs(timestamp DESC)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_logs_archive AS SELECT * FROM activity_logs WHERE 0
+    """)
+    # 归档表使用相同的时间索引，历史查询按时间倒序归并当前和归档记录
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_logs_archive_timestamp
+        ON activity_logs_archive(timestamp DESC)
+    """)
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS activity_logs_all AS
+        SELECT * FROM activity_logs UNION ALL SELECT * FROM activity_logs_archive
+    """)
+    conn.commit()
+    return conn
+
+def _archive_activity_logs(conn: sqlite3.Connection, cutoff: str) -> int:
+    """把早于cutoff的活动日志移入归档表（一个事务内完成），返回归档的行数"""
+    conn.execute("INSERT INTO activity_logs_archive SELECT * FROM activity_logs WHERE timestamp < ?", (cutoff,))
+    archived = conn.execute("DELETE FROM activity_logs WHERE timestamp < ?", (cutoff,)).rowcount
+    conn.commit()
+    return archived
+
+def _write_activity_logs(conn: sqlite3.Connection, rows: List[tuple]):
+    """批量写入活动日志（一次事务提交）"""
+    conn.executemany("""
+        INSERT INTO activity_logs (username, activity_type, details)
+        VALUES (?, ?, ?)
+    """, rows)
+    conn.commit()
+
+def _read_activity_logs(conn: sqlite3.Connection, limit: int) -> List[tuple]:
+    """读取最近的活动日志（包括已归档的记录）"""
+    cursor = conn.execute("""
+        SELECT username, activity_type, details, timestamp
+        FROM activity_logs_all
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, (limit,))
+    return cursor.fetchall()
+
+async def activity_log_flusher(queue: asyncio.Queue, conn: sqlite3.Connection):
+    """活动日志批量写入任务，收到None时写完剩余日志后退出"""
+    running = True
+    while running:
+        # 等待第一条日志，然后取出队列中已积压的日志一起写入
+        batch = [await queue.get()]
+        while len(batch) < ACTIVITY_LOG_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        
+        if None in batch:
+            running = False
+            batch = [row for row in batch if row is not None]
+        
+        if batch:
+            try:
+                await _run_log_db(_write_activity_logs, conn, batch)
+            except Exception as e:
+                logger.error(f"批量写入活动日志失败 ({len(batch)} 条): {e}")
+
 @app.get("/api/admin/logs")
 async def get_activity_logs(
     current_admin: str = Depends(get_current_admin),
@@ -532,26 +941,17 @@ async def get_activity_logs(
 ):
     """获取活动日志（管理员功能）"""
     try:
-        conn = sqlite3.connect("data/activity_logs.db")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT username, activity_type, details, timestamp
-            FROM activity_logs
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (limit,))
+        rows = await _run_log_db(_read_activity_logs, app.state.log_db, limit)
         
         logs = []
-        for row in cursor.fetchall():
+        for row in rows:
             logs.append({
                 "username": row[0],
                 "activity_type": row[1],
-                "details": json.loads(row[2]) if row[2] else {},
+                "details": orjson.loads(row[2]) if row[2] else {},
                 "timestamp": row[3]
             })
         
-        conn.close()
         return {"logs": logs}
         
     except Exception as e:
@@ -566,10 +966,10 @@ async def manual_generate_daily_codes(current_admin: str = Depends(get_current_a
     """手动生成并发送当日验证码（管理员功能）"""
     try:
         # 记录管理员操作
-        await log_user_activity(current_admin, "manual_generate_codes", {"success": True})
+        await log_user_activity(current_admin, "manual_generate_codes", _SUCCESS_DETAILS)
         
         # 生成并发送验证码
-        await generate_and_send_daily_codes()
+        await generate_and_send_daily_codes(force=True)
         
         logger.info(f"管理员 {current_admin} 手动生成了当日验证码")
         
@@ -587,6 +987,20 @@ async def manual_generate_daily_codes(current_admin: str = Depends(get_current_a
             detail=f"生成验证码失败: {str(e)}"
         )
 
+@app.post("/api/admin/reload-users")
+async def reload_users(current_admin: str = Depends(get_current_admin)):
+    """重新加载用户配置文件（管理员功能）"""
+    await asyncio.to_thread(settings.reload_user_config)
+    users = settings.get_users()
+    
+    await log_user_activity(current_admin, "reload_users", {"user_count": len(users)})
+    logger.info(f"管理员 {current_admin} 重新加载了用户配置，共 {len(users)} 个用户")
+    
+    return {
+        "success": True,
+        "user_count": len(users)
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -5,11 +5,20 @@
 
 import os
 import json
+import logging
 import yaml
 from typing import Dict, Any, List
 from pydantic_settings import BaseSettings
 from pydantic import EmailStr
 
+# 优先使用libyaml的C实现解析YAML，未编译libyaml时回退到纯Python实现
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     """应用配置类"""
     
@@ -30,6 +39,7 @@ class Settings(BaseSettings):
         "http://localhost:3000", 
         "http://127.0.0.1:3000"
     ]
+    MAX_SESSIONS_PER_USER: int = 5
     
     # 邮件配置
     SMTP_SERVER: str = "smtp.gmail.com"
@@ -55,6 +65,8 @@ class Settings(BaseSettings):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._users_config = {}
+        self._users_mtime = None
         self._ensure_directories()
         self._load_user_config()
     
@@ -71,11 +83,18 @@ class Settings(BaseSettings):
             self._create_default_user_config(user_config_path)
         
         try:
+            # 文件未修改时沿用已解析的配置，避免重复解析YAML
+            mtime = os.stat(user_config_path).st_mtime_ns
+            if mtime == self._users_mtime:
+                return
+            
             with open(user_config_path, 'r', encoding='utf-8') as f:
-                self._users_config = yaml.safe_load(f) or {}
+                self._users_config = yaml.load(f, Loader=YamlLoader) or {}
+            self._users_mtime = mtime
         except Exception as e:
-            print(f"加载用户配置失败: {e}")
+            logger.error(f"加载用户配置失败: {e}")
             self._users_config = {}
+            self._users_mtime = None
     
     def _create_default_user_config(self, config_path: str):
         """创建默认用户配置文件"""
@@ -97,9 +116,9 @@ class Settings(BaseSettings):
         try:
             with open(config_path, 'w', encoding='utf-8') as f:
                 yaml.dump(default_config, f, default_flow_style=False, allow_unicode=True)
-            print(f"已创建默认用户配置文件: {config_path}")
+            logger.info(f"已创建默认用户配置文件: {config_path}")
         except Exception as e:
-            print(f"创建默认配置文件失败: {e}")
+            logger.error(f"创建默认配置文件失败: {e}")
     
     def get_users(self) -> Dict[str, Dict[str, Any]]:
         """获取用户配置"""
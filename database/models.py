@@ -5,32 +5,259 @@
 
 import sqlite3
 import asyncio
+import logging
 import threading
 import os
-from contextlib import contextmanager
-from typing import Dict, List, Any, Optional
 import json
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+import orjson
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
 
 # 数据库文件路径
 DB_PATH = "data/app.db"
 
+# 数据库内存映射读取的大小上限（字节），读取时直接访问映射页，减少read系统调用
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
 # 数据库连接池（线程安全）
 _local = threading.local()
 
-@contextmanager
-def get_db_connection():
-    """获取数据库连接（线程安全）"""
-    if not hasattr(_local, 'connection'):
-        _local.connection = sqlite3.connect(
+# 所有线程打开的连接及是否只读，关闭时统一执行 PRAGMA optimize（只读连接除外）并关闭；
+# 关闭后代数加一，各线程下次使用时重新建立连接
+_connections: List[Tuple[sqlite3.Connection, bool]] = []
+_connections_lock = threading.Lock()
+_connection_generation = 0
+
+# 数据库操作在线程池中执行，避免阻塞事件循环。写操作集中在单个线程中串行执行，
+# 读操作使用独立的线程池并通过只读连接（get_db_reader）查询；WAL模式下读写互不阻塞
+_db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_db_read_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-read")
+
+# 会话有效期（秒）
+SESSION_TTL_SECONDS = 24 * 60 * 60
+
+# 日志保留天数：更早的记录移入对应的 *_archive 表，保持热表和索引较小
+LOG_RETENTION_DAYS = 30
+_ARCHIVED_LOG_TABLES = ("activity_logs", "workflow_executions", "api_usage_stats")
+
+# 数据库结构版本（PRAGMA user_version）：修改 _SCHEMA_SQL 时加一，
+# 已有数据库需要的升级步骤写在 _create_tables 中
+SCHEMA_VERSION = 1
+
+_SCHEMA_SQL = """
+    -- 用户活动日志表
+    CREATE TABLE IF NOT EXISTS activity_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        activity_type TEXT NOT NULL,
+        details TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        ip_address TEXT,
+        user_agent TEXT
+    );
+    
+    -- 工作流执行记录表
+    CREATE TABLE IF NOT EXISTS workflow_executions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        workflow_type TEXT NOT NULL,
+        inputs TEXT,
+        outputs TEXT,
+        status TEXT DEFAULT 'success',
+        execution_time_ms INTEGER,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        error_message TEXT
+    );
+    
+    -- 执行统计汇总表（按用户和工作流类型累计）
+    CREATE TABLE IF NOT EXISTS workflow_stats_rollup (
+        username TEXT NOT NULL,
+        workflow_type TEXT NOT NULL,
+        total_executions INTEGER NOT NULL DEFAULT 0,
+        successful_executions INTEGER NOT NULL DEFAULT 0,
+        success_time_ms INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, workflow_type)
+    ) WITHOUT ROWID;
+    
+    -- 汇总表为空时（新建或升级）从已有执行记录回填
+    INSERT INTO workflow_stats_rollup
+    SELECT username, workflow_type, COUNT(*), SUM(status = 'success'),
+           COALESCE(SUM(CASE WHEN status = 'success' THEN execution_time_ms END), 0)
+    FROM workflow_executions
+    WHERE NOT EXISTS (SELECT 1 FROM workflow_stats_rollup)
+    GROUP BY username, workflow_type;
+    
+    -- 系统配置表
+    CREATE TABLE IF NOT EXISTS system_config (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- 用户会话表
+    CREATE TABLE IF NOT EXISTS user_sessions (
+        token TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_active DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT TRUE,
+        expires_at INTEGER
+    );
+    
+    -- 每日验证码表
+    CREATE TABLE IF NOT EXISTS daily_codes (
+        username TEXT PRIMARY KEY,
+        code TEXT NOT NULL,
+        email TEXT,
+        generated_at REAL NOT NULL,
+        delivered INTEGER NOT NULL DEFAULT 0,
+        -- 正在发送邮件的进程持有的租约到期时间，到期前其他进程不会重复发送
+        claimed_until REAL NOT NULL DEFAULT 0
+    );
+    
+    -- API调用统计表
+    CREATE TABLE IF NOT EXISTS api_usage_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        method TEXT NOT NULL,
+        status_code INTEGER,
+        response_time_ms INTEGER,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- 索引
+    CREATE INDEX IF NOT EXISTS idx_activity_logs_username_timestamp 
+    ON activity_logs(username, timestamp);
+    
+    -- 不按用户过滤的最近活动查询按时间倒序取前N条，逆序遍历该索引即可，无需排序
+    CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp 
+    ON activity_logs(timestamp DESC);
+    
+    CREATE INDEX IF NOT EXISTS idx_workflow_executions_username_timestamp 
+    ON workflow_executions(username, timestamp);
+    
+    CREATE INDEX IF NOT EXISTS idx_user_sessions_username 
+    ON user_sessions(username);
+    
+    -- 会话过期判断和清理都直接比较 expires_at 列，可以走索引范围扫描
+    CREATE INDEX IF NOT EXISTS idx_user_sessions_expires 
+    ON user_sessions(expires_at);
+    
+    CREATE INDEX IF NOT EXISTS idx_api_usage_stats_username_timestamp 
+    ON api_usage_stats(username, timestamp);
+""" + "".join(
+    # 归档表结构与原表相同
+    f"""
+    CREATE TABLE IF NOT EXISTS {table}_archive AS SELECT * FROM {table} WHERE 0;
+    """
+    for table in _ARCHIVED_LOG_TABLES
+) + """
+    -- activity_logs_all 视图合并当前和已归档的活动记录供历史查询使用；
+    -- 归档表建立与原表相同的索引，按时间倒序取前N条时两边按索引归并，无需排序
+    CREATE INDEX IF NOT EXISTS idx_activity_logs_archive_username_timestamp 
+    ON activity_logs_archive(username, timestamp);
+    
+    CREATE INDEX IF NOT EXISTS idx_activity_logs_archive_timestamp 
+    ON activity_logs_archive(timestamp DESC);
+    
+    CREATE VIEW IF NOT EXISTS activity_logs_all AS
+    SELECT * FROM activity_logs UNION ALL SELECT * FROM activity_logs_archive;
+"""
+
+def _split_statements(script: str) -> List[str]:
+    """把SQL脚本拆分为单条语句（executescript 会先提交当前事务，不能在已加锁的事务中使用）"""
+    statements = []
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer)
+            buffer = ""
+    return statements
+
+_SCHEMA_STATEMENTS = _split_statements(_SCHEMA_SQL)
+
+# 日志批量写入：单次事务最多写入的行数，以及由 start_log_writer() 在事件循环中创建的队列
+LOG_BATCH_SIZE = 500
+_log_write_queue: Optional[asyncio.Queue] = None
+_log_writer_task: Optional[asyncio.Task] = None
+
+_INSERT_ACTIVITY_SQL = """
+    INSERT INTO activity_logs 
+    (username, activity_type, details, ip_address, user_agent)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_INSERT_EXECUTION_SQL = """
+    INSERT INTO workflow_executions 
+    (username, workflow_type, inputs, outputs, status, execution_time_ms, error_message)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 会话最后活动时间通过日志写入任务批量更新，验证会话时无需单独提交写事务
+_UPDATE_LAST_ACTIVE_SQL = """
+    UPDATE user_sessions SET last_active = ? WHERE token = ?
+"""
+
+# 执行统计汇总：每次记录执行时增量更新，统计查询无需扫描全部执行记录
+_UPDATE_STATS_ROLLUP_SQL = """
+    INSERT INTO workflow_stats_rollup 
+    (username, workflow_type, total_executions, successful_executions, success_time_ms)
+    VALUES (?, ?, 1, ?, ?)
+    ON CONFLICT(username, workflow_type) DO UPDATE SET
+        total_executions = total_executions + 1,
+        successful_executions = successful_executions + excluded.successful_executions,
+        success_time_ms = success_time_ms + excluded.success_time_ms
+"""
+
+def _dumps_json(data: Any) -> str:
+    """序列化为JSON字符串（orjson，非字符串键和无法直接序列化的值转为字符串）"""
+    try:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        # orjson不支持超过64位的整数等值，改用标准库json序列化
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+def _connect(readonly: bool) -> sqlite3.Connection:
+    """建立数据库连接并设置PRAGMA"""
+    if readonly:
+        # 只读连接不能修改日志模式，数据库已由写连接切换为WAL模式
+        conn = sqlite3.connect(
+            f"file:{DB_PATH}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            timeout=30.0,
+            cached_statements=512
+        )
+    else:
+        conn = sqlite3.connect(
             DB_PATH,
             check_same_thread=False,
-            timeout=30.0  # 30秒超时
+            timeout=30.0,  # 30秒超时
+            cached_statements=512  # 预编译语句缓存，重复执行的SQL无需重新解析
         )
-        _local.connection.execute("PRAGMA journal_mode=WAL")  # 启用WAL模式提高并发性能
-        _local.connection.execute("PRAGMA synchronous=NORMAL")
-        _local.connection.execute("PRAGMA cache_size=10000")
-        _local.connection.execute("PRAGMA temp_store=memory")
+        conn.execute("PRAGMA page_size=8192")  # 仅对新建的数据库生效，需在启用WAL之前设置
+        conn.execute("PRAGMA journal_mode=WAL")  # 启用WAL模式提高并发性能
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=10000")
+    conn.execute("PRAGMA temp_store=memory")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    with _connections_lock:
+        _connections.append((conn, readonly))
+    return conn
+
+@contextmanager
+def get_db_connection():
+    """获取数据库连接（线程安全）"""
+    if getattr(_local, 'generation', None) != _connection_generation:
+        _local.connection = _connect(readonly=False)
+        _local.generation = _connection_generation
     
     try:
         yield _local.connection
@@ -38,96 +265,176 @@ def get_db_connection():
         _local.connection.rollback()
         raise e
 
+@contextmanager
+def get_db_reader():
+    """获取只读数据库连接（线程安全），用于读线程池中的查询"""
+    if getattr(_local, 'reader_generation', None) != _connection_generation:
+        _local.reader = _connect(readonly=True)
+        _local.reader_generation = _connection_generation
+    
+    yield _local.reader
+
+async def _run_write(func, *args):
+    """在写线程中执行同步数据库操作"""
+    return await asyncio.get_running_loop().run_in_executor(_db_write_executor, func, *args)
+
+async def _run_read(func, *args):
+    """在读线程池中执行同步数据库查询"""
+    return await asyncio.get_running_loop().run_in_executor(_db_read_executor, func, *args)
+
 async def init_database():
     """初始化数据库表"""
     os.makedirs("data", exist_ok=True)
-    
+    await _run_write(_create_tables)
+
+def _create_tables():
+    """创建数据表和索引（结构版本已是最新时跳过）"""
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        # 创建用户活动日志表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS activity_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                activity_type TEXT NOT NULL,
-                details TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ip_address TEXT,
-                user_agent TEXT
-            )
-        """)
-        
-        # 创建工作流执行记录表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS workflow_executions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                workflow_type TEXT NOT NULL,
-                inputs TEXT,
-                outputs TEXT,
-                status TEXT DEFAULT 'success',
-                execution_time_ms INTEGER,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                error_message TEXT
-            )
-        """)
+        # 先取得写锁再读取结构版本，整个结构在这一个事务中创建并记录版本；
+        # 多个进程（如gunicorn多worker）同时启动时只有第一个执行升级，其余等待后看到新版本直接跳过
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
         
-        # 创建系统配置表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS system_config (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 创建用户会话表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                token TEXT PRIMARY KEY,
-                username TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_active DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        """)
-        
-        # 创建API调用统计表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS api_usage_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                endpoint TEXT NOT NULL,
-                method TEXT NOT NULL,
-                status_code INTEGER,
-                response_time_ms INTEGER,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 创建索引优化查询性能
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_activity_logs_username_timestamp 
-            ON activity_logs(username, timestamp)
-        """)
+        if version < SCHEMA_VERSION:
+            # 旧数据库的会话表没有 expires_at 列（Unix时间戳），补上并按创建时间回填
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(user_sessions)")}
+            if columns and "expires_at" not in columns:
+                conn.execute("ALTER TABLE user_sessions ADD COLUMN expires_at INTEGER")
+                conn.execute("""
+                    UPDATE user_sessions
+                    SET expires_at = CAST(strftime('%s', created_at) AS INTEGER) + ?
+                """, (SESSION_TTL_SECONDS,))
+            
+            for statement in _SCHEMA_STATEMENTS:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_workflow_executions_username_timestamp 
-            ON workflow_executions(username, timestamp)
-        """)
+        conn.commit()
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_sessions_username 
-            ON user_sessions(username)
-        """)
+        # 长连接建立时分析一次统计信息，之后由 optimize_database() 定期更新
+        conn.execute("PRAGMA optimize=0x10002")
+
+def _optimize_connection():
+    """更新查询规划器的统计信息"""
+    with get_db_connection() as conn:
+        conn.execute("PRAGMA optimize")
+
+async def optimize_database():
+    """更新查询规划器的统计信息（由后台任务定期调用）"""
+    try:
+        await _run_write(_optimize_connection)
+    except Exception as e:
+        logger.error(f"数据库优化失败: {e}")
+
+def _checkpoint_wal():
+    """把WAL内容写回数据库文件并截断WAL文件"""
+    with get_db_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+async def checkpoint_database():
+    """执行WAL检查点，避免WAL文件在持续写入下无限增长（由后台任务定期调用）"""
+    try:
+        await _run_write(_checkpoint_wal)
+    except Exception as e:
+        logger.error(f"WAL检查点失败: {e}")
+
+def _close_connections():
+    """关闭所有线程的数据库连接，关闭前执行 PRAGMA optimize"""
+    global _connection_generation
+    with _connections_lock:
+        for conn, readonly in _connections:
+            try:
+                if not readonly:
+                    conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                logger.error(f"数据库优化失败: {e}")
+            finally:
+                conn.close()
+        _connections.clear()
+        _connection_generation += 1
+
+async def close_db_connection():
+    """关闭数据库连接（应用关闭时调用，需在日志写入任务停止之后）"""
+    await _run_write(_close_connections)
+
+def _archive_logs(cutoff: str) -> int:
+    """把早于cutoff的日志移入归档表（一个事务内完成），返回归档的行数"""
+    archived = 0
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for table in _ARCHIVED_LOG_TABLES:
+            cursor.execute(f"""
+                INSERT INTO {table}_archive SELECT * FROM {table} WHERE timestamp < ?
+            """, (cutoff,))
+            cursor.execute(f"DELETE FROM {table} WHERE timestamp < ?", (cutoff,))
+            archived += cursor.rowcount
+        conn.commit()
+    return archived
+
+async def archive_old_logs(retention_days: int = LOG_RETENTION_DAYS) -> int:
+    """归档超过保留期的日志（执行统计由汇总表保存，不受归档影响）"""
+    # timestamp列为CURRENT_TIMESTAMP写入的UTC时间字符串
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        return await _run_write(_archive_logs, cutoff)
+    except Exception as e:
+        logger.error(f"归档日志失败: {e}")
+        return 0
+
+def _write_log_batch(batch: List[tuple]):
+    """在一个事务中写入一批日志，batch中每项为 (SQL, 参数)"""
+    rows_by_sql: Dict[str, List[tuple]] = {}
+    for sql, params in batch:
+        rows_by_sql.setdefault(sql, []).append(params)
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for sql, rows in rows_by_sql.items():
+            cursor.executemany(sql, rows)
+        conn.commit()
+
+async def _log_writer(queue: asyncio.Queue):
+    """日志批量写入任务，收到None时写完剩余日志后退出"""
+    running = True
+    while running:
+        # 等待第一条日志，然后取出队列中已积压的日志一起写入
+        batch = [await queue.get()]
+        while len(batch) < LOG_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
         
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_api_usage_stats_username_timestamp 
-            ON api_usage_stats(username, timestamp)
-        """)
+        if None in batch:
+            running = False
+            batch = [item for item in batch if item is not None]
         
-        conn.commit()
+        if batch:
+            try:
+                await _run_write(_write_log_batch, batch)
+            except Exception as e:
+                logger.error(f"批量写入日志失败 ({len(batch)} 条): {e}")
+
+async def start_log_writer():
+    """启动日志批量写入任务（需在事件循环中调用）"""
+    global _log_write_queue, _log_writer_task
+    _log_write_queue = asyncio.Queue()
+    _log_writer_task = asyncio.create_task(_log_writer(_log_write_queue))
+
+async def stop_log_writer():
+    """停止日志批量写入任务，写入队列中剩余的日志"""
+    global _log_write_queue, _log_writer_task
+    if _log_writer_task is None:
+        return
+    await _log_write_queue.put(None)
+    await _log_writer_task
+    _log_write_queue = None
+    _log_writer_task = None
+
+async def _submit_log(*items: tuple):
+    """提交日志，每项为 (SQL, 参数)：写入任务运行时放入队列，否则（如独立脚本中）直接写入"""
+    if _log_write_queue is not None:
+        for item in items:
+            _log_write_queue.put_nowait(item)
+    else:
+        await _run_write(_write_log_batch, list(items))
 
 class ActivityLogger:
     """活动日志记录器"""
@@ -142,31 +449,27 @@ class ActivityLogger:
     ):
         """记录用户活动"""
         try:
-            details_json = json.dumps(details or {}, ensure_ascii=False)
+            # 空详情存为NULL，读取时按空字典返回
+            details_json = _dumps_json(details) if details else None
             
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO activity_logs 
-                    (username, activity_type, details, ip_address, user_agent)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (username, activity_type, details_json, ip_address, user_agent))
-                conn.commit()
+            await _submit_log(
+                (_INSERT_ACTIVITY_SQL, (username, activity_type, details_json, ip_address, user_agent))
+            )
                 
         except Exception as e:
-            print(f"记录活动日志失败: {e}")
+            logger.error(f"记录活动日志失败: {e}")
     
     @staticmethod
     async def get_recent_activities(username: str = None, limit: int = 100) -> List[Dict]:
-        """获取最近的活动记录"""
-        try:
-            with get_db_connection() as conn:
+        """获取最近的活动记录（包括已归档的记录）"""
+        def _query():
+            with get_db_reader() as conn:
                 cursor = conn.cursor()
                 
                 if username:
                     cursor.execute("""
                         SELECT username, activity_type, details, timestamp, ip_address
-                        FROM activity_logs
+                        FROM activity_logs_all
                         WHERE username = ?
                         ORDER BY timestamp DESC
                         LIMIT ?
@@ -174,7 +477,7 @@ class ActivityLogger:
                 else:
                     cursor.execute("""
                         SELECT username, activity_type, details, timestamp, ip_address
-                        FROM activity_logs
+                        FROM activity_logs_all
                         ORDER BY timestamp DESC
                         LIMIT ?
                     """, (limit,))
@@ -184,15 +487,17 @@ class ActivityLogger:
                     activities.append({
                         "username": row[0],
                         "activity_type": row[1],
-                        "details": json.loads(row[2]) if row[2] else {},
+                        "details": orjson.loads(row[2]) if row[2] else {},
                         "timestamp": row[3],
                         "ip_address": row[4]
                     })
                 
                 return activities
-                
+        
+        try:
+            return await _run_read(_query)
         except Exception as e:
-            print(f"获取活动记录失败: {e}")
+            logger.error(f"获取活动记录失败: {e}")
             return []
 
 class WorkflowLogger:
@@ -210,60 +515,49 @@ class WorkflowLogger:
     ):
         """记录工作流执行"""
         try:
-            inputs_json = json.dumps(inputs, ensure_ascii=False)
-            outputs_json = json.dumps(outputs or {}, ensure_ascii=False)
+            inputs_json = _dumps_json(inputs) if inputs else None
+            outputs_json = _dumps_json(outputs) if outputs else None
             
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO workflow_executions 
-                    (username, workflow_type, inputs, outputs, status, execution_time_ms, error_message)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (username, workflow_type, inputs_json, outputs_json, status, execution_time_ms, error_message))
-                conn.commit()
+            succeeded = status == "success"
+            await _submit_log(
+                (_INSERT_EXECUTION_SQL,
+                 (username, workflow_type, inputs_json, outputs_json, status, execution_time_ms, error_message)),
+                (_UPDATE_STATS_ROLLUP_SQL,
+                 (username, workflow_type, int(succeeded), (execution_time_ms or 0) if succeeded else 0))
+            )
                 
         except Exception as e:
-            print(f"记录工作流执行失败: {e}")
+            logger.error(f"记录工作流执行失败: {e}")
     
     @staticmethod
     async def get_execution_stats(username: str = None) -> Dict[str, Any]:
         """获取执行统计信息"""
-        try:
-            with get_db_connection() as conn:
+        def _query():
+            with get_db_reader() as conn:
                 cursor = conn.cursor()
                 
-                # 基础查询条件
+                # 从汇总表按工作流类型读取，总数、成功数和平均耗时由分组结果合计得出
                 where_clause = "WHERE username = ?" if username else ""
                 params = (username,) if username else ()
                 
-                # 总执行次数
-                cursor.execute(f"""
-                    SELECT COUNT(*) FROM workflow_executions {where_clause}
-                """, params)
-                total_executions = cursor.fetchone()[0]
-                
-                # 成功率
-                cursor.execute(f"""
-                    SELECT COUNT(*) FROM workflow_executions 
-                    {where_clause} {"AND" if username else "WHERE"} status = 'success'
-                """, params)
-                successful_executions = cursor.fetchone()[0]
-                
-                # 按工作流类型统计
                 cursor.execute(f"""
-                    SELECT workflow_type, COUNT(*) 
-                    FROM workflow_executions {where_clause}
+                    SELECT workflow_type,
+                           SUM(total_executions),
+                           SUM(successful_executions),
+                           SUM(success_time_ms)
+                    FROM workflow_stats_rollup {where_clause}
                     GROUP BY workflow_type
                 """, params)
-                workflow_stats = dict(cursor.fetchall())
                 
-                # 平均执行时间
-                cursor.execute(f"""
-                    SELECT AVG(execution_time_ms) 
-                    FROM workflow_executions 
-                    {where_clause} {"AND" if username else "WHERE"} status = 'success'
-                """, params)
-                avg_execution_time = cursor.fetchone()[0] or 0
+                workflow_stats = {}
+                total_executions = successful_executions = 0
+                success_time_ms = 0
+                for workflow_type, count, success_count, time_ms in cursor.fetchall():
+                    workflow_stats[workflow_type] = count
+                    total_executions += count
+                    successful_executions += success_count
+                    success_time_ms += time_ms
+                avg_execution_time = success_time_ms / successful_executions if successful_executions > 0 else 0
                 
                 return {
                     "total_executions": total_executions,
@@ -272,62 +566,112 @@ class WorkflowLogger:
                     "workflow_stats": workflow_stats,
                     "avg_execution_time_ms": round(avg_execution_time, 2)
                 }
-                
+        
+        try:
+            return await _run_read(_query)
         except Exception as e:
-            print(f"获取执行统计失败: {e}")
+            logger.error(f"获取执行统计失败: {e}")
             return {}
 
 class SessionManager:
     """会话管理器"""
     
     @staticmethod
-    async def create_session(token: str, username: str):
-        """创建用户会话"""
-        try:
+    async def create_session(token: str, username: str, max_sessions: int = None) -> List[str]:
+        """
+        创建用户会话
+        
+        Args:
+            token: 会话令牌
+            username: 用户名
+            max_sessions: 每个用户保留的最大会话数，超出时删除最早的会话
+        
+        Returns:
+            因超出上限被删除的会话令牌列表
+        """
+        def _create():
             with get_db_connection() as conn:
                 cursor = conn.cursor()
+                now = int(time.time())
                 cursor.execute("""
-                    INSERT OR REPLACE INTO user_sessions (token, username)
-                    VALUES (?, ?)
-                """, (token, username))
-                conn.commit()
+                    INSERT OR REPLACE INTO user_sessions (token, username, expires_at)
+                    VALUES (?, ?, ?)
+                """, (token, username, now + SESSION_TTL_SECONDS))
+                
+                evicted = []
+                if max_sessions:
+                    # 只有有效会话计入上限，已登出或已过期的会话由定期清理任务删除
+                    cursor.execute("""
+                        SELECT token FROM user_sessions
+                        WHERE username = ? AND is_active = TRUE AND expires_at > ?
+                        ORDER BY created_at DESC, rowid DESC
+                        LIMIT -1 OFFSET ?
+                    """, (username, now, max_sessions))
+                    evicted = [row[0] for row in cursor.fetchall()]
+                    cursor.executemany("""
+                        DELETE FROM user_sessions WHERE token = ?
+                    """, [(t,) for t in evicted])
                 
+                conn.commit()
+                return evicted
+        
+        try:
+            return await _run_write(_create)
         except Exception as e:
-            print(f"创建会话失败: {e}")
+            logger.error(f"创建会话失败: {e}")
+            return []
     
     @staticmethod
     async def validate_session(token: str) -> Optional[str]:
-        """验证会话并返回用户名"""
-        try:
-            with get_db_connection() as conn:
+        """验证会话并返回用户名（最后活动时间由日志写入任务批量更新）"""
+        def _query():
+            with get_db_reader() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT username FROM user_sessions
-                    WHERE token = ? AND is_active = TRUE
-                    AND datetime(created_at, '+1 day') > datetime('now')
-                """, (token,))
+                    WHERE token = ? AND is_active = TRUE AND expires_at > ?
+                """, (token, int(time.time())))
+                
+                result = cursor.fetchone()
+                return result[0] if result else None
+        
+        try:
+            username = await _run_read(_query)
+            if username:
+                last_active = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                await _submit_log((_UPDATE_LAST_ACTIVE_SQL, (last_active, token)))
+            return username
+        except Exception as e:
+            logger.error(f"验证会话失败: {e}")
+            return None
+    
+    @staticmethod
+    async def get_active_session(token: str) -> Optional[Dict[str, Any]]:
+        """获取有效会话的用户名和过期时间（Unix时间戳），不更新活动时间"""
+        def _query():
+            with get_db_reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT username, expires_at FROM user_sessions
+                    WHERE token = ? AND is_active = TRUE AND expires_at > ?
+                """, (token, int(time.time())))
                 
                 result = cursor.fetchone()
                 if result:
-                    # 更新最后活动时间
-                    cursor.execute("""
-                        UPDATE user_sessions 
-                        SET last_active = CURRENT_TIMESTAMP
-                        WHERE token = ?
-                    """, (token,))
-                    conn.commit()
-                    return result[0]
+                    return {"username": result[0], "expires_at": result[1]}
                 
                 return None
-                
+        
+        try:
+            return await _run_read(_query)
         except Exception as e:
-            print(f"验证会话失败: {e}")
+            logger.error(f"获取会话失败: {e}")
             return None
     
     @staticmethod
     async def invalidate_session(token: str):
         """使会话失效"""
-        try:
+        def _invalidate():
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -336,30 +680,194 @@ class SessionManager:
                     WHERE token = ?
                 """, (token,))
                 conn.commit()
-                
+        
+        try:
+            return await _run_write(_invalidate)
         except Exception as e:
-            print(f"使会话失效失败: {e}")
+            logger.error(f"使会话失效失败: {e}")
     
     @staticmethod
     async def cleanup_expired_sessions():
         """清理过期会话"""
-        try:
+        def _cleanup():
             with get_db_connection() as conn:
                 cursor = conn.cursor()
+                # 过期会话和已退出登录的会话都不会再被使用，一并删除
                 cursor.execute("""
                     DELETE FROM user_sessions
-                    WHERE datetime(created_at, '+1 day') <= datetime('now')
-                """)
+                    WHERE expires_at <= ? OR is_active = FALSE
+                """, (int(time.time()),))
+                conn.commit()
+        
+        try:
+            return await _run_write(_cleanup)
+        except Exception as e:
+            logger.error(f"清理过期会话失败: {e}")
+
+def _replace_daily_codes(cursor: sqlite3.Cursor, daily_codes: Dict[str, Dict[str, Any]], claimed_until: float = 0):
+    """删除全部旧验证码并写入新的一批"""
+    cursor.execute("DELETE FROM daily_codes")
+    cursor.executemany("""
+        INSERT INTO daily_codes (username, code, email, generated_at, delivered, claimed_until)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (username, info["code"], info.get("email"), info["generated_at"],
+         int(info.get("delivered", False)), claimed_until)
+        for username, info in daily_codes.items()
+    ])
+
+class DailyCodeManager:
+    """每日验证码管理器"""
+    
+    @staticmethod
+    async def save_codes(daily_codes: Dict[str, Dict[str, Any]]):
+        """保存一批验证码（替换全部旧验证码），delivered缺省为未送达"""
+        def _save():
+            with get_db_connection() as conn:
+                _replace_daily_codes(conn.cursor(), daily_codes)
                 conn.commit()
+        
+        await _run_write(_save)
+    
+    @staticmethod
+    async def save_codes_if_stale(
+        daily_codes: Dict[str, Dict[str, Any]],
+        generated_since: float,
+        lease_seconds: float,
+        force: bool = False
+    ) -> bool:
+        """
+        在同一个写事务中检查并保存一批验证码，多个进程同时生成时只有一个能保存成功
+        
+        Args:
+            daily_codes: 新生成的验证码
+            generated_since: 每个用户都已有此时间之后生成的验证码时不保存
+            lease_seconds: 保存成功的进程负责发送邮件，租约期间其他进程不会补发
+            force: 为True时不检查直接替换
+        
+        Returns:
+            是否保存了这批验证码
+        """
+        def _save():
+            with get_db_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if not force:
+                    existing = dict(conn.execute("SELECT username, generated_at FROM daily_codes"))
+                    if all(existing.get(username, 0) >= generated_since for username in daily_codes):
+                        conn.rollback()
+                        return False
+                _replace_daily_codes(conn.cursor(), daily_codes, time.time() + lease_seconds)
+                conn.commit()
+                return True
+        
+        return await _run_write(_save)
+    
+    @staticmethod
+    async def claim_undelivered(usernames: List[str], lease_seconds: float) -> Dict[str, Dict[str, Any]]:
+        """领取邮件尚未送达且没有其他进程正在发送的验证码，返回领取到的验证码"""
+        def _claim():
+            with get_db_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                cursor = conn.execute("""
+                    SELECT username, code, email, generated_at FROM daily_codes
+                    WHERE delivered = 0 AND claimed_until <= ?
+                """, (now,))
+                wanted = set(usernames)
+                claimed = {
+                    row[0]: {"code": row[1], "email": row[2], "generated_at": row[3], "delivered": False}
+                    for row in cursor.fetchall()
+                    if row[0] in wanted
+                }
+                conn.executemany("""
+                    UPDATE daily_codes SET claimed_until = ? WHERE username = ?
+                """, [(now + lease_seconds, username) for username in claimed])
+                conn.commit()
+                return claimed
+        
+        return await _run_write(_claim)
+    
+    @staticmethod
+    async def release_claims(usernames: List[str]):
+        """释放发送失败的验证码的租约，之后的重试可以立即领取"""
+        def _release():
+            with get_db_connection() as conn:
+                conn.executemany("""
+                    UPDATE daily_codes SET claimed_until = 0 WHERE username = ?
+                """, [(username,) for username in usernames])
+                conn.commit()
+        
+        await _run_write(_release)
+    
+    @staticmethod
+    async def mark_delivered(usernames: List[str]):
+        """标记这些用户的验证码邮件已送达"""
+        def _mark():
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    UPDATE daily_codes SET delivered = 1 WHERE username = ?
+                """, [(username,) for username in usernames])
+                conn.commit()
+        
+        await _run_write(_mark)
+    
+    @staticmethod
+    async def get_code(username: str) -> Optional[Dict[str, Any]]:
+        """获取用户的验证码"""
+        def _query():
+            with get_db_reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT code, email, generated_at, delivered FROM daily_codes
+                    WHERE username = ?
+                """, (username,))
+                
+                row = cursor.fetchone()
+                if row:
+                    return {"code": row[0], "email": row[1], "generated_at": row[2], "delivered": bool(row[3])}
+                return None
+        
+        try:
+            return await _run_read(_query)
+        except Exception as e:
+            logger.error(f"获取验证码失败: {e}")
+            return None
+    
+    @staticmethod
+    async def get_all_codes() -> Dict[str, Dict[str, Any]]:
+        """获取全部验证码"""
+        def _query():
+            with get_db_reader() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT username, code, email, generated_at, delivered FROM daily_codes
+                """)
                 
+                return {
+                    row[0]: {"code": row[1], "email": row[2], "generated_at": row[3], "delivered": bool(row[4])}
+                    for row in cursor.fetchall()
+                }
+        
+        try:
+            return await _run_read(_query)
         except Exception as e:
-            print(f"清理过期会话失败: {e}")
+            logger.error(f"获取验证码失败: {e}")
+            return {}
 
 # 导出主要类和函数
 __all__ = [
     'init_database',
+    'optimize_database',
+    'archive_old_logs',
+    'checkpoint_database',
+    'close_db_connection',
+    'start_log_writer',
+    'stop_log_writer',
     'ActivityLogger', 
     'WorkflowLogger',
     'SessionManager',
-    'get_db_connection'
+    'DailyCodeManager',
+    'get_db_connection',
+    'get_db_reader'
 ]
@@ -257,26 +257,25 @@ async def run_demo():
     print("   3. 在 workflows/ 目录下添加新的工作流")
     print("   4. 查看 logs/ 目录下的详细日志")
 
-def create_test_data():
+async def create_test_data():
     """创建测试数据"""
-    import os
-    import json
-    from datetime import datetime
+    import time
+    from database.models import init_database, DailyCodeManager
     
-    # 确保data目录存在
-    os.makedirs("data", exist_ok=True)
+    # 确保数据库已初始化
+    await init_database()
     
     # 创建测试用的每日验证码
     daily_codes = {
         DEMO_USER: {
             "code": DEMO_CODE,
-            "generated_at": datetime.now().isoformat(),
-            "email": "admin@example.com"
+            "generated_at": time.time(),
+            "email": "admin@example.com",
+            "delivered": True
         }
     }
     
-    with open("data/daily_codes.json", "w", encoding="utf-8") as f:
-        json.dump(daily_codes, f, ensure_ascii=False, indent=2)
+    await DailyCodeManager.save_codes(daily_codes)
     
     print(f"✅ 已创建测试验证码: {DEMO_CODE}")
 
@@ -288,7 +287,7 @@ async def main():
     # 检查参数
     if len(sys.argv) > 1:
         if sys.argv[1] == "--create-test-data":
-            create_test_data()
+            await create_test_data()
             return
         elif sys.argv[1] == "--help":
             print("用法:")
@@ -172,6 +172,16 @@ async function showMainSection() {
  * 退出登录
  */
 function logout() {
+    // 通知服务端使令牌失效（不等待结果，网络失败时令牌仍会按有效期过期）
+    if (accessToken) {
+        fetch(`${API_BASE_URL}/auth/logout`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${accessToken}`
+            }
+        }).catch(() => {});
+    }
+    
     // 清除本地存储
     localStorage.removeItem('access_token');
     localStorage.removeItem('username');
@@ -12,8 +12,8 @@ from pathlib import Path
 
 def check_python_version():
     """检查Python版本"""
-    if sys.version_info < (3, 8):
-        print("错误: 需要Python 3.8或更高版本")
+    if sys.version_info < (3, 9):
+        print("错误: 需要Python 3.9或更高版本")
         sys.exit(1)
 
 def install_dependencies():
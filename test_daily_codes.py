@@ -0,0 +1,93 @@
+"""
+每日验证码发送失败后的补发测试
+"""
+
+import asyncio
+import contextlib
+
+import pytest
+
+import backend.app as app_module
+import database.models as models
+from config.settings import Settings
+
+USERS = {
+    "alice": {"email": "alice@example.com"},
+    "bob": {"email": "bob@example.com"},
+}
+
+@pytest.fixture
+def code_env(tmp_path, monkeypatch):
+    """使用临时数据库和固定的用户配置"""
+    monkeypatch.setattr(models, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(Settings, "get_users", lambda self: USERS)
+    asyncio.run(models.init_database())
+    yield
+    asyncio.run(models.close_db_connection())
+
+def _run_job(monkeypatch, send):
+    """在新的事件循环中执行一次验证码任务"""
+    async def _run():
+        monkeypatch.setattr(app_module, "_code_generation_lock", asyncio.Lock())
+        monkeypatch.setattr(app_module, "_send_daily_code_emails", send)
+        await app_module._run_daily_code_job()
+    asyncio.run(_run())
+
+def test_retry_resends_undelivered_codes(code_env, monkeypatch):
+    """SMTP不可用时验证码不算有效，重试只给未送达的用户补发原验证码"""
+    sent = []
+
+    async def smtp_down(messages):
+        raise OSError("SMTP服务器不可用")
+
+    async def partial_send(messages):
+        sent.append([(username, msg.get_content()) for username, msg in messages])
+        return ["bob"]
+
+    async def send_ok(messages):
+        sent.append([(username, msg.get_content()) for username, msg in messages])
+        return []
+
+    with pytest.raises(RuntimeError):
+        _run_job(monkeypatch, smtp_down)
+    assert not asyncio.run(app_module.has_today_valid_codes())
+    codes = asyncio.run(models.DailyCodeManager.get_all_codes())
+
+    with pytest.raises(RuntimeError):
+        _run_job(monkeypatch, partial_send)
+    assert [username for username, _ in sent[0]] == ["alice", "bob"]
+    assert not asyncio.run(app_module.has_today_valid_codes())
+
+    _run_job(monkeypatch, send_ok)
+    assert [username for username, _ in sent[1]] == ["bob"]
+    assert codes["bob"]["code"] in sent[1][0][1]
+    assert asyncio.run(app_module.has_today_valid_codes())
+
+    # 全部送达后不再重复发送
+    _run_job(monkeypatch, send_ok)
+    assert len(sent) == 2
+    assert asyncio.run(models.DailyCodeManager.get_all_codes()) == {
+        username: {**info, "delivered": True} for username, info in codes.items()
+    }
+
+def test_concurrent_generation_sends_one_batch(code_env, monkeypatch):
+    """多个进程同时生成时只有保存成功的一个发送邮件，其余进程不会补发正在发送的验证码"""
+    sent = []
+
+    async def send_ok(messages):
+        await asyncio.sleep(0.05)
+        sent.append({username: msg.get_content() for username, msg in messages})
+        return []
+
+    async def _run():
+        # 每个进程有自己的进程内锁，这里用空锁模拟互不共享锁的多个进程
+        monkeypatch.setattr(app_module, "_code_generation_lock", contextlib.nullcontext())
+        monkeypatch.setattr(app_module, "_send_daily_code_emails", send_ok)
+        return await asyncio.gather(*(app_module.generate_and_send_daily_codes() for _ in range(4)))
+
+    assert sorted(asyncio.run(_run())) == [False, False, False, True]
+    assert len(sent) == 1
+    codes = asyncio.run(models.DailyCodeManager.get_all_codes())
+    for username, info in codes.items():
+        assert info["delivered"]
+        assert info["code"] in sent[0][username]
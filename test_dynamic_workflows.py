@@ -6,32 +6,47 @@
 
 import asyncio
 import aiohttp
-import json
+import orjson
 import sys
 import time
 from typing import Dict, Any
 
+# 有uvloop时使用基于libuv的事件循环（uvicorn[standard]会安装uvloop，Windows上不可用）
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # 配置
 BASE_URL = "http://localhost:8000"
 DEMO_USER = "admin"
 DEMO_CODE = "123456"
+# 演示中同时执行的工作流请求数上限
+DEMO_CONCURRENCY = 8
+
+def _json_dumps(obj: Any) -> str:
+    """请求体使用orjson序列化（aiohttp要求返回字符串）"""
+    return orjson.dumps(obj).decode()
 
 class DynamicWorkflowDemo:
     """动态工作流演示类"""
     
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, session: aiohttp.ClientSession = None):
         self.base_url = base_url
-        self.session = None
+        # 传入的会话由调用方负责关闭，未传入时自行创建和关闭
+        self.session = session
+        self._owns_session = session is None
         self.access_token = None
     
     async def __aenter__(self):
         """异步上下文管理器入口"""
-        self.session = aiohttp.ClientSession()
+        if self._owns_session:
+            self.session = aiohttp.ClientSession(json_serialize=_json_dumps)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """异步上下文管理器出口"""
-        if self.session:
+        if self._owns_session and self.session:
             await self.session.close()
     
     async def login(self, username: str, daily_code: str) -> bool:
@@ -44,7 +59,7 @@ class DynamicWorkflowDemo:
             ) as response:
                 
                 if response.status == 200:
-                    result = await response.json()
+                    result = await response.json(loads=orjson.loads)
                     self.access_token = result["access_token"]
                     return True
                 else:
@@ -64,7 +79,7 @@ class DynamicWorkflowDemo:
             ) as response:
                 
                 if response.status == 200:
-                    result = await response.json()
+                    result = await response.json(loads=orjson.loads)
                     return result["workflows"]
                 else:
                     return []
@@ -93,10 +108,10 @@ class DynamicWorkflowDemo:
             ) as response:
                 
                 if response.status == 200:
-                    result = await response.json()
+                    result = await response.json(loads=orjson.loads)
                     return result
                 else:
-                    error = await response.json()
+                    error = await response.json(loads=orjson.loads)
                     print(f"❌ 工作流执行失败: {error.get('detail', '未知错误')}")
                     return {}
                     
@@ -202,114 +217,128 @@ async def run_demo():
     print("本演示展示前端如何根据后端工作流配置自动渲染界面")
     print()
     
-    # 检查服务是否可用
-    try:
-        async with aiohttp.ClientSession() as session:
+    # 健康检查和演示共用一个会话，复用同一个连接池和keep-alive连接
+    connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector, json_serialize=_json_dumps) as session:
+        # 检查服务是否可用
+        try:
             async with session.get(f"{BASE_URL}/") as response:
                 if response.status != 200:
                     print("❌ 服务不可用，请确保服务器已启动")
                     return
-    except Exception as e:
-        print(f"❌ 无法连接到服务器: {e}")
-        return
-    
-    print("✅ 服务器连接正常")
-    print()
-    
-    async with DynamicWorkflowDemo(BASE_URL) as demo:
-        # 1. 登录
-        print("🔐 正在登录...")
-        if not await demo.login(DEMO_USER, DEMO_CODE):
-            print("❌ 登录失败")
+        except Exception as e:
+            print(f"❌ 无法连接到服务器: {e}")
             return
-        print("✅ 登录成功")
         
-        # 2. 获取工作流列表
-        print("\n📋 获取动态工作流配置...")
-        workflows = await demo.get_workflows()
+        print("✅ 服务器连接正常")
+        print()
         
-        if not workflows:
-            print("❌ 未找到可用工作流")
-            return
+        async with DynamicWorkflowDemo(BASE_URL, session=session) as demo:
+            # 1. 登录
+            print("🔐 正在登录...")
+            if not await demo.login(DEMO_USER, DEMO_CODE):
+                print("❌ 登录失败")
+                return
+            print("✅ 登录成功")
         
-        print(f"✅ 发现 {len(workflows)} 个工作流\n")
+            # 2. 获取工作流列表
+            print("\n📋 获取动态工作流配置...")
+            workflows = await demo.get_workflows()
         
-        # 3. 展示工作流配置信息
-        print("🔍 工作流配置详情:")
-        print("=" * 50)
+            if not workflows:
+                print("❌ 未找到可用工作流")
+                return
         
-        for i, workflow in enumerate(workflows, 1):
-            print(f"\n{i}. ", end="")
-            print_workflow_info(workflow)
+            print(f"✅ 发现 {len(workflows)} 个工作流\n")
         
-        print("\n" + "=" * 50)
+            # 3. 展示工作流配置信息
+            print("🔍 工作流配置详情:")
+            print("=" * 50)
         
-        # 4. 演示动态表单生成和执行
-        print("\n🎯 动态工作流执行演示:")
-        print("-" * 40)
+            for i, workflow in enumerate(workflows, 1):
+                print(f"\n{i}. ", end="")
+                print_workflow_info(workflow)
         
-        for workflow in workflows:
-            print(f"\n🔧 正在测试工作流: {workflow['name']}")
-            
-            # 创建测试输入
-            test_inputs = create_test_inputs(workflow)
-            
-            if test_inputs:
-                print(f"📝 自动生成的测试输入:")
-                for key, value in test_inputs.items():
-                    if isinstance(value, str) and len(value) > 50:
-                        print(f"   {key}: {value[:50]}...")
-                    else:
-                        print(f"   {key}: {value}")
-            else:
-                print("📝 无需输入参数")
+            print("\n" + "=" * 50)
+        
+            # 4. 演示动态表单生成和执行
+            print("\n🎯 动态工作流执行演示:")
+            print("-" * 40)
+        
+            # 先生成并展示全部测试输入
+            all_inputs = []
+            for workflow in workflows:
+                print(f"\n🔧 测试工作流: {workflow['name']}")
+                
+                # 创建测试输入
+                test_inputs = create_test_inputs(workflow)
+                all_inputs.append(test_inputs)
+                
+                if test_inputs:
+                    print(f"📝 自动生成的测试输入:")
+                    for key, value in test_inputs.items():
+                        if isinstance(value, str) and len(value) > 50:
+                            print(f"   {key}: {value[:50]}...")
+                        else:
+                            print(f"   {key}: {value}")
+                else:
+                    print("📝 无需输入参数")
             
-            # 执行工作流
-            print("⚡ 执行中...")
-            start_time = time.time()
+            # 并发执行全部工作流，由信号量限制同时进行的请求数
+            print(f"\n⚡ 并发执行 {len(workflows)} 个工作流...")
+            semaphore = asyncio.Semaphore(DEMO_CONCURRENCY)
             
-            result = await demo.execute_workflow(workflow['name'], test_inputs)
+            async def timed_execute(workflow_name: str, inputs: Dict[str, Any]):
+                async with semaphore:
+                    start_time = time.time()
+                    result = await demo.execute_workflow(workflow_name, inputs)
+                    return result, time.time() - start_time
             
-            execution_time = time.time() - start_time
+            results = await asyncio.gather(*[
+                timed_execute(workflow['name'], test_inputs)
+                for workflow, test_inputs in zip(workflows, all_inputs)
+            ])
             
-            if result and result.get('success'):
-                print(f"✅ 执行成功 (耗时: {execution_time:.2f}秒)")
-                
-                outputs = result.get('result', {}).get('outputs', {})
+            # 按工作流顺序展示结果
+            for workflow, (result, execution_time) in zip(workflows, results):
+                print(f"\n🔧 工作流: {workflow['name']}")
                 
-                # 显示结果摘要
-                if isinstance(outputs, dict):
-                    print("📊 结果摘要:")
-                    for key, value in outputs.items():
-                        if key == 'summary':
-                            print(f"   📝 {key}: {value}")
-                        elif key in ['title', 'sentiment', 'language']:
-                            print(f"   🔖 {key}: {value}")
-                        elif key == 'basic_stats' and isinstance(value, dict):
-                            print(f"   📈 基础统计: {value.get('word_count', 0)}词, {value.get('sentence_count', 0)}句")
-                        elif key == 'keywords' and isinstance(value, list):
-                            print(f"   🔍 关键词: {', '.join(value[:5])}")
+                if result and result.get('success'):
+                    print(f"✅ 执行成功 (耗时: {execution_time:.2f}秒)")
+                    
+                    outputs = result.get('result', {}).get('outputs', {})
+                    
+                    # 显示结果摘要
+                    if isinstance(outputs, dict):
+                        print("📊 结果摘要:")
+                        for key, value in outputs.items():
+                            if key == 'summary':
+                                print(f"   📝 {key}: {value}")
+                            elif key in ['title', 'sentiment', 'language']:
+                                print(f"   🔖 {key}: {value}")
+                            elif key == 'basic_stats' and isinstance(value, dict):
+                                print(f"   📈 基础统计: {value.get('word_count', 0)}词, {value.get('sentence_count', 0)}句")
+                            elif key == 'keywords' and isinstance(value, list):
+                                print(f"   🔍 关键词: {', '.join(value[:5])}")
+                    else:
+                        print(f"   📄 结果: {outputs}")
                 else:
-                    print(f"   📄 结果: {outputs}")
-            else:
-                print("❌ 执行失败")
-            
-            await asyncio.sleep(0.5)  # 短暂延迟
+                    print("❌ 执行失败")
         
-        print("\n" + "=" * 60)
-        print("✨ 动态工作流演示完成！")
-        print()
-        print("💡 关键特性:")
-        print("   🔹 前端根据JSON Schema自动生成表单")
-        print("   🔹 支持多种字段类型：文本、选择、布尔、数组等")
-        print("   🔹 动态结果显示，适配不同工作流输出")
-        print("   🔹 可扩展架构，添加新工作流无需修改前端")
-        print()
-        print("🚀 接下来你可以:")
-        print("   1. 访问 http://localhost:8000 体验Web界面")
-        print("   2. 在 workflows/ 目录添加新的工作流类")
-        print("   3. 在 backend/app.py 中注册新工作流")
-        print("   4. 前端将自动识别并渲染新工作流")
+            print("\n" + "=" * 60)
+            print("✨ 动态工作流演示完成！")
+            print()
+            print("💡 关键特性:")
+            print("   🔹 前端根据JSON Schema自动生成表单")
+            print("   🔹 支持多种字段类型：文本、选择、布尔、数组等")
+            print("   🔹 动态结果显示，适配不同工作流输出")
+            print("   🔹 可扩展架构，添加新工作流无需修改前端")
+            print()
+            print("🚀 接下来你可以:")
+            print("   1. 访问 http://localhost:8000 体验Web界面")
+            print("   2. 在 workflows/ 目录添加新的工作流类")
+            print("   3. 在 backend/app.py 中注册新工作流")
+            print("   4. 前端将自动识别并渲染新工作流")
 
 if __name__ == "__main__":
     print("🎯 动态工作流系统演示程序")
@@ -335,4 +364,6 @@ if __name__ == "__main__":
         sys.exit(0)
     
     print()
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(run_demo())
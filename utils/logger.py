@@ -3,12 +3,41 @@
 统一的日志格式和配置
 """
 
+import atexit
 import logging
 import os
+import queue
 import sys
 from datetime import datetime
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
-from typing import Optional
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import List, Optional
+
+class _RoutingQueueHandler(QueueHandler):
+    """将记录连同所属记录器的处理器一起放入共享队列"""
+    
+    def __init__(self, log_queue: queue.SimpleQueue, handlers: List[logging.Handler]):
+        super().__init__(log_queue)
+        self.target_handlers = handlers
+    
+    def enqueue(self, record: logging.LogRecord):
+        self.queue.put_nowait((self.target_handlers, record))
+
+class _RoutingQueueListener(QueueListener):
+    """从共享队列取出记录，交给记录所属记录器的处理器"""
+    
+    def handle(self, item):
+        handlers, record = item
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+# 所有日志记录器共用一个队列和一个后台监听线程：控制台/文件写入在后台线程中完成，
+# 不阻塞调用方（包括事件循环）；消息格式化仍在调用方线程中由 QueueHandler.prepare 完成。
+# 进程退出时停止监听器并写完队列中剩余的记录
+_log_queue = queue.SimpleQueue()
+_log_listener = _RoutingQueueListener(_log_queue)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 def setup_logger(
     name: str,
@@ -50,7 +79,7 @@ def setup_logger(
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # 文件处理器
     if log_file:
@@ -68,7 +97,10 @@ def setup_logger(
         )
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    # 记录器只挂队列处理器，实际的处理器由后台监听线程调用
+    logger.addHandler(_RoutingQueueHandler(_log_queue, handlers))
     
     return logger
 
@@ -133,38 +165,24 @@ class SecurityLogger:
     
     def log_login_attempt(self, username: str, success: bool, ip_address: str = None):
         """记录登录尝试"""
-        status = "成功" if success else "失败"
-        message = f"登录尝试 - 用户: {username}, 状态: {status}"
-        if ip_address:
-            message += f", IP: {ip_address}"
-        
-        if success:
-            self.logger.info(message)
-        else:
-            self.logger.warning(message)
+        # 消息使用%参数，记录被级别过滤时不做格式化；缺省字段统一记为"-"
+        self.logger.log(
+            logging.INFO if success else logging.WARNING,
+            "登录尝试 - 用户: %s, 状态: %s, IP: %s",
+            username, "成功" if success else "失败", ip_address or "-"
+        )
     
     def log_invalid_token(self, token_prefix: str, ip_address: str = None):
         """记录无效token访问"""
-        message = f"无效token访问 - Token前缀: {token_prefix[:8]}..."
-        if ip_address:
-            message += f", IP: {ip_address}"
-        self.logger.warning(message)
+        self.logger.warning("无效token访问 - Token前缀: %s..., IP: %s", token_prefix[:8], ip_address or "-")
     
     def log_rate_limit_exceeded(self, username: str, endpoint: str, ip_address: str = None):
         """记录速率限制超出"""
-        message = f"速率限制超出 - 用户: {username}, 端点: {endpoint}"
-        if ip_address:
-            message += f", IP: {ip_address}"
-        self.logger.warning(message)
+        self.logger.warning("速率限制超出 - 用户: %s, 端点: %s, IP: %s", username, endpoint, ip_address or "-")
     
     def log_suspicious_activity(self, description: str, username: str = None, ip_address: str = None):
         """记录可疑活动"""
-        message = f"可疑活动 - {description}"
-        if username:
-            message += f", 用户: {username}"
-        if ip_address:
-            message += f", IP: {ip_address}"
-        self.logger.warning(message)
+        self.logger.warning("可疑活动 - %s, 用户: %s, IP: %s", description, username or "-", ip_address or "-")
 
 class APILogger:
     """API访问日志记录器"""
@@ -186,18 +204,18 @@ class APILogger:
         ip_address: str = None
     ):
         """记录API请求"""
-        message = f"{method} {path} - {status_code} - {response_time_ms:.1f}ms"
-        if username:
-            message += f" - 用户: {username}"
-        if ip_address:
-            message += f" - IP: {ip_address}"
-        
         if status_code < 400:
-            self.logger.info(message)
+            level = logging.INFO
         elif status_code < 500:
-            self.logger.warning(message)
+            level = logging.WARNING
         else:
-            self.logger.error(message)
+            level = logging.ERROR
+        
+        self.logger.log(
+            level,
+            "%s %s - %d - %.1fms - 用户: %s - IP: %s",
+            method, path, status_code, response_time_ms, username or "-", ip_address or "-"
+        )
     
     def log_workflow_execution(
         self,
@@ -208,16 +226,11 @@ class APILogger:
         error_message: str = None
     ):
         """记录工作流执行"""
-        status = "成功" if success else "失败"
-        message = f"工作流执行 - {workflow_name} - 用户: {username} - 状态: {status} - {execution_time_ms:.1f}ms"
-        
-        if error_message:
-            message += f" - 错误: {error_message}"
-        
-        if success:
-            self.logger.info(message)
-        else:
-            self.logger.error(message)
+        self.logger.log(
+            logging.INFO if success else logging.ERROR,
+            "工作流执行 - %s - 用户: %s - 状态: %s - %.1fms - 错误: %s",
+            workflow_name, username, "成功" if success else "失败", execution_time_ms, error_message or "-"
+        )
 
 class PerformanceLogger:
     """性能监控日志记录器"""
@@ -232,16 +245,16 @@ class PerformanceLogger:
     def log_slow_query(self, query: str, execution_time_ms: float, threshold_ms: float = 1000):
         """记录慢查询"""
         if execution_time_ms > threshold_ms:
-            self.logger.warning(f"慢查询 - {execution_time_ms:.1f}ms - {query[:100]}...")
+            self.logger.warning("慢查询 - %.1fms - %s...", execution_time_ms, query[:100])
     
     def log_memory_usage(self, usage_mb: float, threshold_mb: float = 500):
         """记录内存使用"""
         if usage_mb > threshold_mb:
-            self.logger.warning(f"高内存使用 - {usage_mb:.1f}MB")
+            self.logger.warning("高内存使用 - %.1fMB", usage_mb)
     
     def log_api_performance(self, endpoint: str, avg_response_time_ms: float, request_count: int):
         """记录API性能统计"""
-        self.logger.info(f"API性能 - {endpoint} - 平均响应时间: {avg_response_time_ms:.1f}ms - 请求数: {request_count}")
+        self.logger.info("API性能 - %s - 平均响应时间: %.1fms - 请求数: %d", endpoint, avg_response_time_ms, request_count)
 
 # 全局日志记录器实例
 security_logger = SecurityLogger()
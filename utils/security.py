@@ -5,21 +5,42 @@
 
 import hashlib
 import secrets
-import string
 import hmac
 import time
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from collections import deque
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping
+from datetime import datetime
 import ipaddress
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
+# PBKDF2-SHA256迭代次数（修改后已有的密码哈希将无法验证）
+PASSWORD_HASH_ITERATIONS = 100000
+
+# 速率限制：每个标识符的尝试时间（time.monotonic()秒）按时间顺序存放在deque中，
+# 检查时只弹出该标识符已过期的记录；其他标识符的过期记录定期统一清理
+_RATE_LIMIT_SWEEP_SECONDS = 60
+_last_rate_limit_sweep = 0.0
+
+# 校验用的正则在导入时编译一次
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# 只允许字母、数字、下划线，长度3-20（\Z 不接受末尾换行）
+_USERNAME_RE = re.compile(r'^[a-zA-Z0-9_]{3,20}\Z')
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+# 可疑User-Agent关键字合并为一个正则，一次扫描完成匹配
+_SUSPICIOUS_UA_RE = re.compile(r'bot|crawler|spider|scraper|curl|wget|python|requests', re.IGNORECASE)
+
 def generate_secure_token(length: int = 32) -> str:
     """生成安全的随机令牌"""
     return secrets.token_urlsafe(length)
 
 def generate_daily_code() -> str:
     """生成6位数字验证码"""
-    return ''.join(secrets.choice(string.digits) for _ in range(6))
+    # 一次取[0, 1000000)内的均匀随机数，补零到6位
+    return f"{secrets.randbelow(1_000_000):06d}"
 
 def hash_password(password: str, salt: Optional[str] = None) -> tuple[str, str]:
     """
@@ -40,26 +61,28 @@ def hash_password(password: str, salt: Optional[str] = None) -> tuple[str, str]:
         'sha256',
         password.encode('utf-8'),
         salt.encode('utf-8'),
-        100000  # 迭代次数
+        PASSWORD_HASH_ITERATIONS
     )
     
     return hashed.hex(), salt
 
 def verify_password(password: str, hashed_password: str, salt: str) -> bool:
     """验证密码"""
-    hashed, _ = hash_password(password, salt)
-    return hmac.compare_digest(hashed, hashed_password)
+    hashed = hashlib.pbkdf2_hmac(
+        'sha256',
+        password.encode('utf-8'),
+        salt.encode('utf-8'),
+        PASSWORD_HASH_ITERATIONS
+    )
+    return hmac.compare_digest(hashed.hex(), hashed_password)
 
 def validate_email(email: str) -> bool:
     """验证邮箱格式"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 def validate_username(username: str) -> bool:
     """验证用户名格式"""
-    # 只允许字母、数字、下划线，长度3-20
-    pattern = r'^[a-zA-Z0-9_]{3,20}$'
-    return re.match(pattern, username) is not None
+    return _USERNAME_RE.match(username) is not None
 
 def validate_ip_address(ip: str) -> bool:
     """验证IP地址格式"""
@@ -92,7 +115,7 @@ def sanitize_input(input_str: str, max_length: int = 1000) -> str:
         return ""
     
     # 移除控制字符
-    sanitized = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', input_str)
+    sanitized = _CONTROL_CHARS_RE.sub('', input_str)
     
     # 限制长度
     if len(sanitized) > max_length:
@@ -119,6 +142,8 @@ def check_rate_limit(
     Returns:
         (is_allowed, remaining_attempts)
     """
+    global _last_rate_limit_sweep
+    
     if storage is None:
         # 这里应该使用持久化存储，如Redis
         # 为了简单起见，使用内存存储
@@ -126,27 +151,31 @@ def check_rate_limit(
             check_rate_limit._storage = {}
         storage = check_rate_limit._storage
     
-    now = datetime.now()
-    window_start = now - timedelta(minutes=window_minutes)
+    now = time.monotonic()
+    cutoff = now - window_minutes * 60
     
-    # 清理过期记录
-    expired_keys = []
-    for key, timestamps in storage.items():
-        storage[key] = [ts for ts in timestamps if ts > window_start]
-        if not storage[key]:
-            expired_keys.append(key)
+    # 定期清理其他标识符的过期记录，避免不再出现的标识符一直占用内存
+    if now - _last_rate_limit_sweep > _RATE_LIMIT_SWEEP_SECONDS:
+        _last_rate_limit_sweep = now
+        for key in [key for key, attempts in storage.items() if not attempts or attempts[-1] < cutoff]:
+            del storage[key]
     
-    for key in expired_keys:
-        del storage[key]
+    # 弹出当前标识符的过期记录
+    attempts = storage.get(identifier)
+    if attempts is None:
+        return True, max_attempts
     
-    # 检查当前标识符的尝试次数
-    attempts = storage.get(identifier, [])
-    recent_attempts = [ts for ts in attempts if ts > window_start]
+    while attempts and attempts[0] < cutoff:
+        attempts.popleft()
     
-    if len(recent_attempts) >= max_attempts:
+    if not attempts:
+        del storage[identifier]
+        return True, max_attempts
+    
+    if len(attempts) >= max_attempts:
         return False, 0
     
-    return True, max_attempts - len(recent_attempts)
+    return True, max_attempts - len(attempts)
 
 def record_attempt(identifier: str, storage: Optional[Dict[str, Any]] = None):
     """记录尝试"""
@@ -155,11 +184,7 @@ def record_attempt(identifier: str, storage: Optional[Dict[str, Any]] = None):
             check_rate_limit._storage = {}
         storage = check_rate_limit._storage
     
-    now = datetime.now()
-    if identifier not in storage:
-        storage[identifier] = []
-    
-    storage[identifier].append(now)
+    storage.setdefault(identifier, deque()).append(time.monotonic())
 
 def generate_csrf_token() -> str:
     """生成CSRF令牌"""
@@ -169,16 +194,42 @@ def verify_csrf_token(token: str, expected_token: str) -> bool:
     """验证CSRF令牌"""
     return hmac.compare_digest(token, expected_token)
 
-def create_secure_headers() -> Dict[str, str]:
-    """创建安全HTTP头"""
-    return {
-        "X-Content-Type-Options": "nosniff",
-        "X-Frame-Options": "DENY",
-        "X-XSS-Protection": "1; mode=block",
-        "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
-        "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline' cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' cdn.jsdelivr.net; font-src 'self' cdn.jsdelivr.net; img-src 'self' data:",
-        "Referrer-Policy": "strict-origin-when-cross-origin"
-    }
+# 安全HTTP头在导入时构建一次（只读），并预先编码为ASGI头部格式
+_SECURE_HEADERS: Mapping[str, str] = MappingProxyType({
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline' cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' cdn.jsdelivr.net; font-src 'self' cdn.jsdelivr.net; img-src 'self' data:",
+    "Referrer-Policy": "strict-origin-when-cross-origin"
+})
+_SECURE_HEADER_PAIRS = tuple(
+    (name.lower().encode("latin-1"), value.encode("latin-1"))
+    for name, value in _SECURE_HEADERS.items()
+)
+
+def create_secure_headers() -> Mapping[str, str]:
+    """获取安全HTTP头（共享的只读映射，需要修改时请先复制）"""
+    return _SECURE_HEADERS
+
+class SecurityHeadersMiddleware:
+    """ASGI中间件：为每个HTTP响应追加安全头（使用模块级预编码的头部，每个响应只做一次列表拼接）"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.headers = _SECURE_HEADER_PAIRS
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *self.headers]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
 
 def mask_sensitive_data(data: str, mask_char: str = "*", visible_chars: int = 4) -> str:
     """掩码敏感数据"""
@@ -193,13 +244,8 @@ def is_suspicious_activity(
     previous_ips: list[str] = None
 ) -> bool:
     """检测可疑活动"""
-    suspicious_patterns = [
-        r'bot', r'crawler', r'spider', r'scraper',
-        r'curl', r'wget', r'python', r'requests'
-    ]
-    
     # 检查User-Agent
-    if any(re.search(pattern, user_agent.lower()) for pattern in suspicious_patterns):
+    if _SUSPICIOUS_UA_RE.search(user_agent) is not None:
         return True
     
     # 检查IP地址变化
@@ -235,7 +281,7 @@ class SecurityAuditor:
         self.suspicious_events.append(event)
         
         # 这里应该发送到安全监控系统
-        print(f"[SECURITY ALERT] {event_type}: {description}")
+        logger.warning(f"[SECURITY ALERT] {event_type}: {description}")
     
     def check_login_pattern(self, user_id: str, success: bool, ip_address: str):
         """检查登录模式"""
@@ -266,6 +312,7 @@ __all__ = [
     'generate_csrf_token',
     'verify_csrf_token',
     'create_secure_headers',
+    'SecurityHeadersMiddleware',
     'mask_sensitive_data',
     'is_suspicious_activity',
     'SecurityAuditor',
@@ -4,23 +4,46 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional, Type
+from typing import Dict, Any, List, Optional, Tuple, Type
 import asyncio
+import hashlib
 import time
 import logging
+import orjson
+from cachetools import TTLCache
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# 可缓存工作流的结果缓存容量和有效期（秒）
+RESULT_CACHE_SIZE = 1000
+RESULT_CACHE_TTL_SECONDS = 3600
+
+# 输入参数模式中的类型名与Python类型的对应关系
+SCHEMA_TYPE_MAPPING = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict
+}
+
 class BaseWorkflow(ABC):
     """工作流基类"""
     
+    # 结果只由输入决定的工作流可设为True，相同输入在缓存有效期内直接复用执行结果
+    cacheable = False
+    
     def __init__(self):
         self.name = self.__class__.__name__
         self.description = ""
         self.version = "1.0.0"
         self.input_schema = {}
         self.output_schema = {}
+        # 共享的HTTP客户端（httpx.AsyncClient），由WorkflowManager注入
+        self.http_client = None
+        self._input_rules = None
     
     @abstractmethod
     async def execute(self, inputs: Dict[str, Any], username: str) -> Dict[str, Any]:
@@ -49,8 +72,7 @@ class BaseWorkflow(ABC):
     def validate_inputs(self, inputs: Dict[str, Any]) -> bool:
         """验证输入参数"""
         try:
-            schema = self.get_input_schema()
-            required_fields = schema.get("required", [])
+            required_fields, field_types = self._get_input_rules()
             
             # 检查必需字段
             for field in required_fields:
@@ -58,12 +80,10 @@ class BaseWorkflow(ABC):
                     raise ValueError(f"缺少必需参数: {field}")
             
             # 检查字段类型
-            properties = schema.get("properties", {})
             for field, value in inputs.items():
-                if field in properties:
-                    expected_type = properties[field].get("type")
-                    if expected_type and not self._check_type(value, expected_type):
-                        raise ValueError(f"参数 {field} 类型错误，期望 {expected_type}")
+                rule = field_types.get(field)
+                if rule and not isinstance(value, rule[1]):
+                    raise ValueError(f"参数 {field} 类型错误，期望 {rule[0]}")
             
             return True
             
@@ -71,18 +91,28 @@ class BaseWorkflow(ABC):
             logger.error(f"输入验证失败: {e}")
             return False
     
+    def _get_input_rules(self) -> Tuple[Tuple[str, ...], Dict[str, Tuple[str, Any]]]:
+        """
+        获取编译后的输入校验规则（首次使用时由输入参数模式构建并缓存）
+        
+        Returns:
+            (必需字段, {字段名: (模式类型名, 对应的Python类型)})
+        """
+        if self._input_rules is None:
+            schema = self.get_input_schema()
+            field_types = {}
+            for field, spec in schema.get("properties", {}).items():
+                expected_type = spec.get("type")
+                python_type = SCHEMA_TYPE_MAPPING.get(expected_type)
+                if python_type:
+                    field_types[field] = (expected_type, python_type)
+            self._input_rules = (tuple(schema.get("required", [])), field_types)
+        
+        return self._input_rules
+    
     def _check_type(self, value: Any, expected_type: str) -> bool:
         """检查值类型"""
-        type_mapping = {
-            "string": str,
-            "integer": int,
-            "number": (int, float),
-            "boolean": bool,
-            "array": list,
-            "object": dict
-        }
-        
-        expected_python_type = type_mapping.get(expected_type)
+        expected_python_type = SCHEMA_TYPE_MAPPING.get(expected_type)
         if expected_python_type:
             return isinstance(value, expected_python_type)
         
@@ -101,7 +131,16 @@ class WorkflowManager:
     
     def __init__(self):
         self._workflows: Dict[str, BaseWorkflow] = {}
+        self._workflow_info: Dict[str, Dict[str, Any]] = {}
         self._execution_stats: Dict[str, Dict[str, Any]] = {}
+        self._revision = 0
+        self._http_client = None
+        self._result_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_SECONDS)
+    
+    @property
+    def revision(self) -> int:
+        """工作流列表版本号，注册、注销或统计信息变化时递增"""
+        return self._revision
     
     def register_workflow(self, name: str, workflow: BaseWorkflow):
         """注册工作流"""
@@ -109,35 +148,46 @@ class WorkflowManager:
             raise ValueError("工作流必须继承自 BaseWorkflow")
         
         self._workflows[name] = workflow
+        workflow.http_client = self._http_client
+        # 工作流描述和参数模式注册后不再变化，预先构建避免每次请求重复生成
+        self._workflow_info[name] = {
+            "name": name,
+            "description": workflow.description,
+            "version": workflow.version,
+            "input_schema": workflow.get_input_schema(),
+            "output_schema": workflow.get_output_schema()
+        }
         self._execution_stats[name] = {
             "total_executions": 0,
             "successful_executions": 0,
             "total_execution_time": 0.0,
             "average_execution_time": 0.0
         }
+        self._revision += 1
         
         logger.info(f"工作流已注册: {name}")
     
+    def set_http_client(self, client):
+        """设置所有工作流共享的HTTP客户端（传入None时恢复为各自临时创建）"""
+        self._http_client = client
+        for workflow in self._workflows.values():
+            workflow.http_client = client
+    
     def unregister_workflow(self, name: str):
         """注销工作流"""
         if name in self._workflows:
             del self._workflows[name]
+            del self._workflow_info[name]
             del self._execution_stats[name]
+            self._revision += 1
             logger.info(f"工作流已注销: {name}")
     
     def get_available_workflows(self) -> List[Dict[str, Any]]:
         """获取可用工作流列表"""
-        workflows = []
-        for name, workflow in self._workflows.items():
-            workflows.append({
-                "name": name,
-                "description": workflow.description,
-                "version": workflow.version,
-                "input_schema": workflow.get_input_schema(),
-                "output_schema": workflow.get_output_schema(),
-                "stats": self._execution_stats.get(name, {})
-            })
-        return workflows
+        return [
+            {**info, "stats": self._execution_stats.get(name, {})}
+            for name, info in self._workflow_info.items()
+        ]
     
     async def execute_workflow(
         self, 
@@ -166,7 +216,7 @@ class WorkflowManager:
             processed_inputs = await workflow.preprocess(inputs)
             
             # 执行工作流
-            outputs = await workflow.execute(processed_inputs, username)
+            outputs = await self._execute_with_cache(workflow_name, workflow, processed_inputs, username)
             
             # 后处理
             final_outputs = await workflow.postprocess(outputs)
@@ -218,6 +268,34 @@ class WorkflowManager:
             logger.error(f"工作流执行失败: {execution_id}, 错误: {e}")
             raise e
     
+    async def _execute_with_cache(
+        self,
+        workflow_name: str,
+        workflow: BaseWorkflow,
+        inputs: Dict[str, Any],
+        username: str
+    ) -> Dict[str, Any]:
+        """执行工作流，可缓存的工作流优先返回相同输入的缓存结果"""
+        if not workflow.cacheable:
+            return await workflow.execute(inputs, username)
+        
+        try:
+            key_data = orjson.dumps({"w": workflow_name, "i": inputs}, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # 输入中有orjson无法序列化的值（如超过64位的整数），不使用缓存直接执行
+            return await workflow.execute(inputs, username)
+        cache_key = hashlib.blake2b(key_data, digest_size=16).digest()
+        
+        outputs = self._result_cache.get(cache_key)
+        if outputs is None:
+            outputs = await workflow.execute(inputs, username)
+            self._result_cache[cache_key] = outputs
+        else:
+            logger.info(f"工作流命中结果缓存: {workflow_name}, 用户: {username}")
+        
+        # 后处理会修改结果字典，返回副本以免改动缓存内容
+        return dict(outputs)
+    
     async def _update_stats(self, workflow_name: str, execution_time: float, success: bool):
         """更新工作流统计信息"""
         if workflow_name not in self._execution_stats:
@@ -225,6 +303,7 @@ class WorkflowManager:
         
         stats = self._execution_stats[workflow_name]
         stats["total_executions"] += 1
+        self._revision += 1
         stats["total_execution_time"] += execution_time
         
         if success:
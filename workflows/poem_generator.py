@@ -6,7 +6,9 @@
 import asyncio
 import httpx
 import json
+import orjson
 import logging
+from types import MappingProxyType
 from typing import Dict, Any
 from datetime import datetime
 
@@ -15,6 +17,43 @@ from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# 提示词模板和风格说明在模块加载时构建一次，每次调用只填充变量
+LENGTH_GUIDE = {
+    "短诗": "4-8行",
+    "中等": "12-20行", 
+    "长诗": "24-40行"
+}
+
+STYLE_GUIDE = {
+    "古典": "使用古典诗词的韵律和意象，注重平仄和对仗",
+    "现代": "使用现代诗歌的自由表达方式，注重情感和意境",
+    "自由诗": "不拘格律，自由表达情感和思想",
+    "律诗": "遵循律诗格律，八句四联，讲究平仄对仗",
+    "绝句": "四句诗，注重意境和韵律"
+}
+
+POEM_PROMPT_TEMPLATE = """请以"{theme}"为主题创作一首{style}风格的诗歌。
+
+要求：
+1. 风格特点：{style_guide}
+2. 长度：{length_guide}
+3. 内容要求：围绕主题"{theme}"展开，情感真挚，意境优美
+4. 语言要求：用词精准，富有诗意
+
+请按以下JSON格式返回结果：
+{{
+    "title": "诗歌标题",
+    "poem": "诗歌正文\\n每行用\\n分隔",
+    "analysis": "简要的创作说明，包括主题表达和艺术特色"
+}}
+
+请确保返回的是有效的JSON格式。"""
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "你是一位优秀的诗人，擅长创作各种风格的诗歌。请根据用户的要求创作诗歌，并确保返回的是有效的JSON格式。"
+}
+
 class PoemWorkflow(BaseWorkflow):
     """诗歌生成工作流"""
     
@@ -22,6 +61,12 @@ class PoemWorkflow(BaseWorkflow):
         super().__init__()
         self.description = "基于给定主题生成诗歌"
         self.version = "1.0.0"
+        # API地址和请求头在进程内不变，创建时构建一次
+        self._api_url = f"{settings.QWEN_BASE_URL}/chat/completions"
+        self._api_headers = MappingProxyType({
+            "Authorization": f"Bearer {settings.QWEN_API_KEY}",
+            "Content-Type": "application/json"
+        })
     
     def get_input_schema(self) -> Dict[str, Any]:
         """获取输入参数模式"""
@@ -111,56 +156,22 @@ class PoemWorkflow(BaseWorkflow):
     
     def _build_prompt(self, theme: str, style: str, length: str) -> str:
         """构建提示词"""
-        length_guide = {
-            "短诗": "4-8行",
-            "中等": "12-20行", 
-            "长诗": "24-40行"
-        }
-        
-        style_guide = {
-            "古典": "使用古典诗词的韵律和意象，注重平仄和对仗",
-            "现代": "使用现代诗歌的自由表达方式，注重情感和意境",
-            "自由诗": "不拘格律，自由表达情感和思想",
-            "律诗": "遵循律诗格律，八句四联，讲究平仄对仗",
-            "绝句": "四句诗，注重意境和韵律"
-        }
-        
-        prompt = f"""请以"{theme}"为主题创作一首{style}风格的诗歌。
-
-要求：
-1. 风格特点：{style_guide.get(style, "自然流畅的表达")}
-2. 长度：{length_guide.get(length, "适中长度")}
-3. 内容要求：围绕主题"{theme}"展开，情感真挚，意境优美
-4. 语言要求：用词精准，富有诗意
-
-请按以下JSON格式返回结果：
-{{
-    "title": "诗歌标题",
-    "poem": "诗歌正文\\n每行用\\n分隔",
-    "analysis": "简要的创作说明，包括主题表达和艺术特色"
-}}
-
-请确保返回的是有效的JSON格式。"""
-
-        return prompt
+        return POEM_PROMPT_TEMPLATE.format(
+            theme=theme,
+            style=style,
+            style_guide=STYLE_GUIDE.get(style, "自然流畅的表达"),
+            length_guide=LENGTH_GUIDE.get(length, "适中长度")
+        )
     
     async def _call_qwen_api(self, prompt: str) -> str:
         """调用Qwen API"""
         if not settings.QWEN_API_KEY:
             raise WorkflowError("Qwen API密钥未配置", "poem_generator")
         
-        headers = {
-            "Authorization": f"Bearer {settings.QWEN_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "model": "qwen-turbo",
             "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一位优秀的诗人，擅长创作各种风格的诗歌。请根据用户的要求创作诗歌，并确保返回的是有效的JSON格式。"
-                },
+                SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": prompt
@@ -170,27 +181,39 @@ class PoemWorkflow(BaseWorkflow):
             "max_tokens": 1000
         }
         
+        # 优先使用应用共享的连接池，单独运行工作流时才临时创建客户端
+        if self.http_client is not None:
+            return await self._request_completion(self.http_client, payload)
+        
         async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    f"{settings.QWEN_BASE_URL}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                if "choices" not in result or not result["choices"]:
-                    raise WorkflowError("API返回格式错误", "poem_generator")
-                
-                content = result["choices"][0]["message"]["content"]
-                return content
-                
-            except httpx.RequestError as e:
-                raise WorkflowError(f"API请求失败: {str(e)}", "poem_generator")
-            except httpx.HTTPStatusError as e:
-                raise WorkflowError(f"API返回错误 {e.response.status_code}: {e.response.text}", "poem_generator")
+            return await self._request_completion(client, payload)
+    
+    async def _request_completion(
+        self,
+        client: httpx.AsyncClient,
+        payload: Dict[str, Any]
+    ) -> str:
+        """发送对话补全请求并返回生成内容"""
+        try:
+            response = await client.post(
+                self._api_url,
+                headers=self._api_headers,
+                content=orjson.dumps(payload)
+            )
+            response.raise_for_status()
+            
+            result = orjson.loads(response.content)
+            
+            if "choices" not in result or not result["choices"]:
+                raise WorkflowError("API返回格式错误", "poem_generator")
+            
+            content = result["choices"][0]["message"]["content"]
+            return content
+            
+        except httpx.RequestError as e:
+            raise WorkflowError(f"API请求失败: {str(e)}", "poem_generator")
+        except httpx.HTTPStatusError as e:
+            raise WorkflowError(f"API返回错误 {e.response.status_code}: {e.response.text}", "poem_generator")
     
     async def _parse_poem_result(self, api_result: str, theme: str, style: str, length: str) -> Dict[str, Any]:
         """解析API返回的诗歌结果"""
@@ -16,6 +16,9 @@ logger = logging.getLogger(__name__)
 class TextAnalyzerWorkflow(BaseWorkflow):
     """文本分析工作流"""
     
+    # 分析结果只由输入文本和参数决定
+    cacheable = True
+    
     def __init__(self):
         super().__init__()
         self.description = "文本内容分析与统计"